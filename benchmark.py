@@ -0,0 +1,299 @@
+""" Train models a number of times and record the number of training episodes, time spent and final win rate.
+
+    Independent training runs are spread over a pool of worker processes, every run with its own random seed.
+    The results are written to a CSV or JSON file (depending on the file extension) which can be plotted later.
+
+    The scaling benchmark does the same for generated mazes of increasing size, and also measures the number
+    of steps per second of Maze and VectorMaze and the peak memory use per training.
+
+    Usage:
+        python -m benchmark run --models QTableModel QTableTraceModel --runs 50 --output results.csv
+        python -m benchmark plot results.csv
+        python -m benchmark scaling --sizes 8 16 32 64 --output scaling.csv
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import models
+from environment import Maze, VectorMaze
+from environment.generator import generate
+
+# the maze from main.py, used if no maze file is given
+MAZE = np.array([
+    [0, 1, 0, 0, 0, 0, 0, 0],
+    [0, 1, 0, 1, 0, 1, 0, 0],
+    [0, 0, 0, 1, 1, 0, 1, 0],
+    [0, 1, 0, 1, 0, 0, 0, 0],
+    [1, 0, 0, 1, 0, 1, 0, 0],
+    [0, 0, 0, 1, 0, 1, 1, 1],
+    [0, 1, 1, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 1, 0, 0]
+])  # 0 = free, 1 = occupied
+
+MODELS = ["QTableModel", "SarsaTableModel", "QTableTraceModel", "QNetworkModel", "QReplayNetworkModel"]
+
+FIELDS = ["model", "run", "seed", "episodes", "seconds", "win_rate"]
+
+SCALING_FIELDS = ["size", "model", "steps_per_second", "episodes", "seconds", "win_rate", "peak_memory_mb"]
+
+
+def train(job):
+    """ Train a single model from scratch. Runs in a worker process.
+
+        :param tuple job: (model name, run number, seed, maze, dict with hyperparameters)
+        :return dict: Result of this run, with keys as in FIELDS.
+    """
+    name, run_no, seed, maze, hyperparameters = job
+
+    random.seed(seed)
+    np.random.seed(seed)
+    logging.disable(logging.WARNING)
+
+    game = Maze(maze)
+
+    with tempfile.TemporaryDirectory() as directory:  # models which save themselves must not share a file
+        model = models.get(name)(game, name=os.path.join(directory, name))
+
+        start_time = time.perf_counter()
+        _, episodes, _ = model.train(**hyperparameters)
+        seconds = time.perf_counter() - start_time
+
+        _, win_rate = game.win_all(model)
+
+    return dict(model=name, run=run_no, seed=seed, episodes=episodes, seconds=seconds, win_rate=win_rate)
+
+
+def run_all(names, maze, runs=50, hyperparameters=None, workers=None, seed=0):
+    """ Train every model 'runs' times, spreading the runs over a pool of processes.
+
+        :param list names: Names of the model classes to train.
+        :param numpy.array maze: Maze to train on.
+        :param int runs: Number of training runs per model.
+        :param dict hyperparameters: Keyword arguments for model.train().
+        :param int workers: Number of processes (optional, else one per cpu).
+        :param int seed: Seed of the first run, following runs use seed + 1, seed + 2, ...
+        :return list: One dict per run, with keys as in FIELDS.
+    """
+    hyperparameters = dict() if hyperparameters is None else hyperparameters
+    jobs = [(name, r, seed + i * runs + r, maze, hyperparameters) for i, name in enumerate(names) for r in range(runs)]
+
+    with Pool(processes=workers) as pool:
+        results = pool.map(train, jobs, chunksize=1)
+
+    for name in names:
+        episodes = [r["episodes"] for r in results if r["model"] == name]
+        seconds = [r["seconds"] for r in results if r["model"] == name]
+        logging.info("model: {} | trained {} times | average no of episodes: {}| average training time {:.3f}"
+                     .format(name, runs, np.average(episodes), np.average(seconds)))
+
+    return results
+
+
+def throughput(game, steps):
+    """ Measure how many random steps per second an agent makes in Maze, and a batch of agents in VectorMaze.
+
+        :param class Maze game: Maze to step through.
+        :param int steps: Number of steps to make.
+        :return float, float: Steps per second for Maze, steps per second for VectorMaze
+    """
+    actions = np.random.randint(len(game.actions), size=steps)
+
+    game.reset(random.choice(game.empty))
+    start_time = time.perf_counter()
+    for action in actions:
+        _, _, status = game.step(action)
+        if status != "playing":
+            game.reset(random.choice(game.empty))
+    maze_rate = steps / (time.perf_counter() - start_time)
+
+    n = max(1, min(1000, 10 ** 8 // game.maze.size))  # VectorMaze keeps n copies of the maze, limit memory use
+    batches = np.random.randint(len(game.actions), size=(max(1, steps // n), n))
+    vector = VectorMaze(game.maze, n, exit_cell=game.exit_cell)
+    start_time = time.perf_counter()
+    for batch in batches:
+        vector.step(batch)
+    vector_rate = batches.size / (time.perf_counter() - start_time)
+
+    return maze_rate, vector_rate
+
+
+def scale(job):
+    """ Measure throughput or train a single model on a generated maze. Runs in a worker process of its own, so
+        the peak memory use (resident set size) is that of this job only.
+
+        :param tuple job: (maze size, model name or None for throughput, generation method, seed, steps,
+                           dict with hyperparameters)
+        :return list: One or two dicts with keys as in SCALING_FIELDS.
+    """
+    size, name, method, seed, steps, hyperparameters = job
+
+    random.seed(seed)
+    np.random.seed(seed)
+    logging.disable(logging.WARNING)
+
+    game = Maze(generate(size, size, method, seed), reuse_buffers=True)  # no caller keeps a state
+
+    if name is None:
+        maze_rate, vector_rate = throughput(game, steps)
+        return [dict(size=size, model="Maze", steps_per_second=maze_rate),
+                dict(size=size, model="VectorMaze", steps_per_second=vector_rate)]
+
+    with tempfile.TemporaryDirectory() as directory:  # models which save themselves must not share a file
+        model = models.get(name)(game, name=os.path.join(directory, name))
+
+        start_time = time.perf_counter()
+        _, episodes, _ = model.train(**hyperparameters)
+        seconds = time.perf_counter() - start_time
+
+        _, win_rate = game.win_all(model)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kilobytes on Linux
+
+    return [dict(size=size, model=name, episodes=episodes, seconds=seconds, win_rate=win_rate, peak_memory_mb=peak)]
+
+
+def scaling(names, sizes, method="backtracker", seed=0, steps=100000, hyperparameters=None, workers=None):
+    """ Measure step throughput and train every model on generated square mazes of increasing size.
+
+        :param list names: Names of the model classes to train.
+        :param list sizes: Number of rows (= columns) of the mazes.
+        :param str method: Maze generation method (see environment.generator).
+        :param int seed: Seed for maze generation and training.
+        :param int steps: Number of steps to measure the throughput with.
+        :param dict hyperparameters: Keyword arguments for model.train().
+        :param int workers: Number of processes (optional, else one per cpu).
+        :return list: Dicts with keys as in SCALING_FIELDS.
+    """
+    hyperparameters = dict() if hyperparameters is None else hyperparameters
+    jobs = [(size, name, method, seed, steps, hyperparameters) for size in sizes for name in [None] + list(names)]
+
+    with Pool(processes=workers, maxtasksperchild=1) as pool:
+        results = [r for rows in pool.map(scale, jobs, chunksize=1) for r in rows]
+
+    for r in results:
+        if "steps_per_second" in r:
+            logging.info("size: {} | {} | steps per second: {:.0f}"
+                         .format(r["size"], r["model"], r["steps_per_second"]))
+        else:
+            logging.info("size: {} | model: {} | episodes: {} | training time {:.3f} | win rate: {:.5f} | "
+                         "peak memory: {:.1f} MB".format(r["size"], r["model"], r["episodes"], r["seconds"],
+                                                         r["win_rate"], r["peak_memory_mb"]))
+
+    return results
+
+
+def save(results, filename, fields=FIELDS):
+    """ Write results to a .json file, or else to a .csv file. """
+    with open(filename, "w", newline="") as outfile:
+        if filename.endswith(".json"):
+            json.dump(results, outfile, indent=1)
+        else:
+            writer = csv.DictWriter(outfile, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def load(filename):
+    """ Read results from a .json or .csv file as written by save(). """
+    with open(filename, "r", newline="") as infile:
+        if filename.endswith(".json"):
+            return json.load(infile)
+        results = list(csv.DictReader(infile))
+
+    for r in results:
+        r["run"] = int(r["run"])
+        r["seed"] = int(r["seed"])
+        r["episodes"] = int(r["episodes"])
+        r["seconds"] = float(r["seconds"])
+        r["win_rate"] = float(r["win_rate"])
+
+    return results
+
+
+def plot(results):
+    """ Plot the number of training episodes and the training time per model in histograms. """
+    import matplotlib.pyplot as plt
+
+    names = list(dict.fromkeys(r["model"] for r in results))  # unique names, in order of appearance
+
+    f, (epi_ax, sec_ax) = plt.subplots(2, len(names), sharex="row", sharey="row", tight_layout=True, squeeze=False)
+
+    for i, name in enumerate(names):
+        epi_ax[i].set_title(name)
+        epi_ax[i].set_xlabel("training episodes")
+        epi_ax[i].hist([r["episodes"] for r in results if r["model"] == name], edgecolor="black")
+
+        sec_ax[i].set_xlabel("seconds per training")
+        sec_ax[i].hist([r["seconds"] for r in results if r["model"] == name], edgecolor="black")
+
+    plt.show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description=__doc__.split("\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="train models and save the results")
+    run.add_argument("--models", nargs="+", default=MODELS, choices=MODELS, help="models to train")
+    run.add_argument("--maze", help=".npy file with the maze (default: the maze from main.py)")
+    run.add_argument("--runs", type=int, default=50, help="number of training runs per model")
+    run.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes")
+    run.add_argument("--seed", type=int, default=0, help="random seed of the first run")
+    run.add_argument("--discount", type=float, default=0.90)
+    run.add_argument("--exploration-rate", type=float, default=0.10)
+    run.add_argument("--learning-rate", type=float, default=0.10)
+    run.add_argument("--episodes", type=int, default=10000)
+    run.add_argument("--output", default="benchmark.csv", help=".csv or .json file for the results")
+
+    show = commands.add_parser("plot", help="plot saved results in histograms")
+    show.add_argument("results", help=".csv or .json file written by 'run'")
+
+    grow = commands.add_parser("scaling", help="measure throughput and training on mazes of increasing size")
+    grow.add_argument("--models", nargs="+", default=["QTableModel", "QTableTraceModel", "ValueIterationModel"],
+                      help="models to train")
+    grow.add_argument("--sizes", nargs="+", type=int, default=[8, 16, 32, 64], help="number of rows and columns")
+    grow.add_argument("--method", default="backtracker", choices=["backtracker", "prim", "random"])
+    grow.add_argument("--seed", type=int, default=0, help="random seed for maze generation and training")
+    grow.add_argument("--steps", type=int, default=100000, help="number of steps to measure throughput")
+    grow.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes")
+    grow.add_argument("--discount", type=float, default=0.90)
+    grow.add_argument("--exploration-rate", type=float, default=0.10)
+    grow.add_argument("--learning-rate", type=float, default=0.10)
+    grow.add_argument("--episodes", type=int, default=10000)
+    grow.add_argument("--output", default="scaling.csv", help=".csv or .json file for the results")
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(levelname)s: %(asctime)s: %(message)s",
+                        datefmt="%H:%M:%S")
+
+    if args.command == "run":
+        maze = MAZE if args.maze is None else np.load(args.maze)
+        hyperparameters = dict(discount=args.discount, exploration_rate=args.exploration_rate,
+                               learning_rate=args.learning_rate, episodes=args.episodes)
+        results = run_all(args.models, maze, args.runs, hyperparameters, args.workers, args.seed)
+        save(results, args.output)
+        logging.info("results written to {}".format(args.output))
+    elif args.command == "scaling":
+        hyperparameters = dict(discount=args.discount, exploration_rate=args.exploration_rate,
+                               learning_rate=args.learning_rate, episodes=args.episodes)
+        results = scaling(args.models, args.sizes, args.method, args.seed, args.steps, hyperparameters, args.workers)
+        save(results, args.output, SCALING_FIELDS)
+        logging.info("results written to {}".format(args.output))
+    else:
+        plot(load(args.results))
+
+
+if __name__ == "__main__":
+    main()
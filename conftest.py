@@ -0,0 +1 @@
+""" Makes the packages in the root of the repository importable when the tests are run with plain pytest. """
@@ -1 +1,4 @@
 from .maze import Maze
+from .recorder import TrajectoryRecorder
+from .trajectory_log import TrajectoryReader, TrajectoryWriter
+from .vectormaze import VectorMaze
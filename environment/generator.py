@@ -0,0 +1,177 @@
+""" Create random mazes of any size.
+
+    Three methods are available:
+    - "backtracker": recursive backtracker (depth first search), long winding corridors
+    - "prim": randomized Prim's algorithm, many short dead ends
+    - "random": every cell is a wall with a given probability
+
+    Whatever the method, the exit (lower right) is always reachable from the start (upper left).
+
+    Usage:
+        python -m environment.generator 100 100 --method prim --seed 1 --output maze.npy
+"""
+import argparse
+from collections import deque
+
+import numpy as np
+
+from environment.maze import CELL_EMPTY, CELL_OCCUPIED, moves
+
+
+def generate(ncols, nrows, method="backtracker", seed=None, density=0.3):
+    """ Create a maze where the exit in the lower right corner can be reached from the upper left corner.
+
+        :param int ncols: Number of columns.
+        :param int nrows: Number of rows.
+        :param str method: "backtracker", "prim" or "random".
+        :param int seed: Seed for the random generator (optional, else unpredictable).
+        :param float density: Probability of a wall per cell, only used by method "random".
+        :return numpy.array: 2D Array containing empty cells (=0) and cells occupied with walls (=1).
+    """
+    rng = np.random.default_rng(seed)
+
+    if method == "backtracker":
+        maze = _backtracker(ncols, nrows, rng)
+    elif method == "prim":
+        maze = _prim(ncols, nrows, rng)
+    elif method == "random":
+        maze = np.where(rng.random((nrows, ncols)) < density, CELL_OCCUPIED, CELL_EMPTY).astype(np.int8)
+        maze[0, 0] = CELL_EMPTY
+    else:
+        raise Exception("Error: unknown maze generation method {}".format(method))
+
+    _connect(maze, (0, 0), (ncols - 1, nrows - 1))
+
+    return maze
+
+
+def save(filename, maze):
+    """ Save a maze to a .npy file, which can be read with numpy.load(). """
+    np.save(filename, maze)
+
+
+def _neighbours(row, col, nrows, ncols):
+    """ Cells two steps away in every direction, these are the cells of the grid the corridors are carved in. """
+    for dcol, drow in moves.values():
+        r = row + 2 * drow
+        c = col + 2 * dcol
+        if 0 <= r < nrows and 0 <= c < ncols:
+            yield r, c
+
+
+def _backtracker(ncols, nrows, rng):
+    """ Carve corridors with a depth first search from the upper left cell, backtracking at dead ends. """
+    maze = np.full((nrows, ncols), CELL_OCCUPIED, dtype=np.int8)
+    maze[0, 0] = CELL_EMPTY
+    stack = [(0, 0)]
+
+    while stack:
+        row, col = stack[-1]
+        options = [(r, c) for r, c in _neighbours(row, col, nrows, ncols) if maze[r, c] == CELL_OCCUPIED]
+        if not options:
+            stack.pop()
+            continue
+        r, c = options[rng.integers(len(options))]
+        maze[(row + r) // 2, (col + c) // 2] = CELL_EMPTY  # remove the wall in between
+        maze[r, c] = CELL_EMPTY
+        stack.append((r, c))
+
+    return maze
+
+
+def _prim(ncols, nrows, rng):
+    """ Grow the maze from the upper left cell by repeatedly connecting a random cell on its border. """
+    maze = np.full((nrows, ncols), CELL_OCCUPIED, dtype=np.int8)
+    in_frontier = np.zeros((nrows, ncols), dtype=bool)
+    maze[0, 0] = CELL_EMPTY
+    frontier = []
+
+    def add_frontier(row, col):
+        for r, c in _neighbours(row, col, nrows, ncols):
+            if maze[r, c] == CELL_OCCUPIED and not in_frontier[r, c]:
+                in_frontier[r, c] = True
+                frontier.append((r, c))
+
+    add_frontier(0, 0)
+
+    while frontier:
+        i = rng.integers(len(frontier))
+        frontier[i], frontier[-1] = frontier[-1], frontier[i]  # swap with the last one so removal is cheap
+        row, col = frontier.pop()
+
+        options = [(r, c) for r, c in _neighbours(row, col, nrows, ncols) if maze[r, c] == CELL_EMPTY]
+        r, c = options[rng.integers(len(options))]
+        maze[(row + r) // 2, (col + c) // 2] = CELL_EMPTY
+        maze[row, col] = CELL_EMPTY
+        add_frontier(row, col)
+
+    return maze
+
+
+def _connect(maze, start_cell, exit_cell):
+    """ Make sure exit_cell can be reached from start_cell by removing as few walls as possible.
+
+        First all cells reachable from the start are marked. Then a breadth first search from the exit, in which
+        stepping onto a wall costs 1 and onto an empty cell 0, finds the cheapest route to a marked cell. The walls
+        on this route are removed.
+    """
+    nrows, ncols = maze.shape
+    start = start_cell[1] * ncols + start_cell[0]
+    exit = exit_cell[1] * ncols + exit_cell[0]
+    grid = maze.reshape(-1)  # a view, so changes apply to the maze
+
+    def neighbours(cell):
+        row, col = divmod(cell, ncols)
+        for dcol, drow in moves.values():
+            r = row + drow
+            c = col + dcol
+            if 0 <= r < nrows and 0 <= c < ncols:
+                yield r * ncols + c
+
+    reachable = np.zeros(maze.size, dtype=bool)
+    reachable[start] = True
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        for n in neighbours(cell):
+            if not reachable[n] and grid[n] == CELL_EMPTY:
+                reachable[n] = True
+                queue.append(n)
+
+    if reachable[exit]:
+        return
+
+    cost = np.full(maze.size, np.iinfo(np.int64).max)
+    parent = np.full(maze.size, -1, dtype=np.int64)
+    cost[exit] = 0
+    queue = deque([exit])
+    while queue:
+        cell = queue.popleft()
+        if reachable[cell]:
+            break
+        for n in neighbours(cell):
+            step = 0 if grid[n] == CELL_EMPTY else 1
+            if cost[cell] + step < cost[n]:
+                cost[n] = cost[cell] + step
+                parent[n] = cell
+                if step == 0:
+                    queue.appendleft(n)
+                else:
+                    queue.append(n)
+
+    while cell != -1:  # walk back to the exit, clearing all walls on the way
+        grid[cell] = CELL_EMPTY
+        cell = parent[cell]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m environment.generator", description="Create a random maze.")
+    parser.add_argument("ncols", type=int, help="number of columns")
+    parser.add_argument("nrows", type=int, help="number of rows")
+    parser.add_argument("--method", default="backtracker", choices=["backtracker", "prim", "random"])
+    parser.add_argument("--seed", type=int, help="seed for the random generator")
+    parser.add_argument("--density", type=float, default=0.3, help="probability of a wall (method random)")
+    parser.add_argument("--output", default="maze.npy", help=".npy file to write the maze to")
+    args = parser.parse_args()
+
+    save(args.output, generate(args.ncols, args.nrows, args.method, args.seed, args.density))
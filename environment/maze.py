@@ -1,8 +1,13 @@
+import hashlib
 import logging
+import random
+from concurrent.futures import ProcessPoolExecutor
 
 import matplotlib.pyplot as plt
 import numpy as np
 
+from profiling import NullProfiler
+
 CELL_EMPTY = 0  # indicates empty cell where the agent can move to
 CELL_OCCUPIED = 1  # indicates cell which contains a wall and cannot be entered
 CELL_CURRENT = 2  # indicates current cell of the agent
@@ -20,6 +25,73 @@ actions = {
     MOVE_DOWN: "move down"
 }
 
+# change in (col, row) per action
+moves = {
+    MOVE_LEFT: (-1, 0),
+    MOVE_RIGHT: (1, 0),
+    MOVE_UP: (0, -1),
+    MOVE_DOWN: (0, 1)
+}
+
+NO_CELL = -1  # indicates a move which is blocked by a wall or the edge of the maze
+
+
+def build_transitions(maze):
+    """ Create a table with the cell which is reached for every (cell, action) combination.
+
+        Cells are identified by their index in the flattened maze (index = row * ncols + col).
+
+        :param numpy.array maze: 2D Array containing empty cells (=0) and cells occupied with walls (=1).
+        :return numpy.array [size][num_actions]: Next cell index per cell and action, or NO_CELL if blocked.
+    """
+    nrows, ncols = maze.shape
+    grid = maze.flatten()
+    rows, cols = np.divmod(np.arange(maze.size), ncols)
+    transitions = np.full((maze.size, len(moves)), NO_CELL, dtype=np.int64)
+
+    for action, (dcol, drow) in moves.items():
+        r = rows + drow
+        c = cols + dcol
+        inside = (r >= 0) & (r < nrows) & (c >= 0) & (c < ncols)
+        target = np.where(inside, r * ncols + c, 0)
+        free = inside & (grid[target] != CELL_OCCUPIED)
+        transitions[:, action] = np.where(free, target, NO_CELL)
+
+    return transitions
+
+
+def check_cell(maze, cell, name, exit_cell=None):
+    """ Check that a (col, row) cell can be used as start- or exit cell, raise an Exception if not.
+
+        :param numpy.array maze: 2D Array containing empty cells (=0) and cells occupied with walls (=1).
+        :param tuple cell: Cell to check.
+        :param str name: "start" or "exit", used in the error message.
+        :param tuple exit_cell: Exit cell, which cannot be the start cell (optional, else not checked).
+    """
+    nrows, ncols = maze.shape
+    col, row = cell
+    if not (0 <= col < ncols and 0 <= row < nrows):
+        raise Exception("Error: {} cell at {} is not inside maze".format(name, cell))
+    if maze[row, col] == CELL_OCCUPIED:
+        raise Exception("Error: {} cell at {} is not free".format(name, cell))
+    if exit_cell is not None and tuple(cell) == tuple(exit_cell):
+        raise Exception("Error: start- and exit cell cannot be the same {}".format(cell))
+
+
+def _play_games(model, cells):
+    """ Play a game from every cell in 'cells' using the maze the model is attached to. Runs in a worker process.
+
+        :param class AbstractModel model: The prediction model to use (a copy, including its maze).
+        :param list cells: Starting cells.
+        :return int, int: Number of games won, number of games lost
+    """
+    random.seed()  # worker processes inherit the random state of the parent, so reseed
+    np.random.seed()
+
+    results = [model.environment.play(model, cell) for cell in cells]
+    win = results.count("win")
+    return win, len(results) - win
+
 
 class Maze:
     """ A maze with walls. An agent is placed at the start cell and moves through the maze to get to the exit cell.
@@ -38,17 +110,46 @@ class Maze:
         This way of storing coordinates is in line with what matplotlibs plot() function expects as inputs. The maze
         itself is stored as a 2D numpy array so cells are accessed via [row, col]. To convert a (col, row) tuple
         to (row, col) use: (col, row)[::-1]
+
+        A note on observations (= the state returned by reset() and step()):
+        By default the state is the complete maze as a [1][size] vector with the agents cell marked (mode "grid").
+        Other modes are the index of the agents cell ("cell"), its (col, row) coordinates ("coordinates"), a
+        [1][size] vector with a 1 at the agents cell ("onehot"), or the k x k cells around the agent ("window",
+        cells outside the maze are walls). Every state is a new array, unless reuse_buffers is set: then the "grid"
+        and "onehot" states are written into two alternating preallocated buffers, so a step only updates two
+        entries, but a state stays valid during the next step only and must be copied to keep it longer.
     """
 
-    def __init__(self, maze, start_cell=(0, 0), exit_cell=None):
+    observations = ("grid", "cell", "coordinates", "onehot", "window")
+
+    def __init__(self, maze, start_cell=(0, 0), exit_cell=None, observation="grid", window=5, reuse_buffers=False):
         """ Create a new maze with a specific start- and exit-cell.
 
             :param numpy.array maze: 2D Array containing empty cells (=0) and cells occupied with walls (=1).
             :param tuple start_cell: Starting cell for the agent in the maze (optional, else upper left).
             :param tuple exit_cell: Exit cell which the agent has to reach (optional, else lower right).
+            :param str observation: How the state is represented (optional, else "grid"), see the class docstring.
+            :param int window: Number of rows and columns in a "window" observation (must be odd).
+            :param bool reuse_buffers: Write "grid" and "onehot" states into two alternating buffers instead of new
+                                       arrays, see the class docstring.
         """
+        if observation not in self.observations:
+            raise Exception("Error: unknown observation mode {}".format(observation))
+        if observation == "window" and window % 2 == 0:
+            raise Exception("Error: window size {} is not odd".format(window))
+
         self.maze = maze
+        self.observation = observation
+        self.window = window
+        self.reuse_buffers = reuse_buffers
         self.display = False  # draw grid and moves or not
+        self.workers = 1  # number of processes win_all() uses to play games, 1 = play in this process
+        self.executor = None  # Executor win_all() plays games in if workers > 1, None = use a pool of its own
+        self.__pool = None  # process pool created on first use when no executor is given, kept until close()
+        self.__pool_workers = 0  # number of processes in self.__pool
+        self.recorder = None  # TrajectoryRecorder which records the agents moves, None = do not record
+        self.writer = None  # TrajectoryWriter which logs every transition to disk, None = do not log
+        self.profiler = NullProfiler()  # Profiler which times the phases of a game and of training, see profiling
         self.__minimum_reward = -0.5 * self.maze.size  # stop game if accumulated reward is below this threshold
 
         self.actions = [MOVE_LEFT, MOVE_RIGHT, MOVE_UP, MOVE_DOWN]
@@ -61,31 +162,112 @@ class Maze:
         self.cells = [(col, row) for col in range(ncols) for row in range(nrows)]
         self.empty = [(col, row) for col in range(ncols) for row in range(nrows) if self.maze[row, col] == CELL_EMPTY]
 
-        if exit_cell not in self.cells:
-            raise Exception("Error: exit cell at {} is not inside maze".format(exit_cell))
-        if self.maze[exit_cell[::-1]] == CELL_OCCUPIED:
-            raise Exception("Error: exit cell at {} is not free".format(exit_cell))
+        check_cell(self.maze, exit_cell, "exit")
 
         self.empty.remove(exit_cell)
+
+        # precalculate the outcome of every move, so stepping is a table lookup instead of checking walls
+        self.transitions = build_transitions(self.maze)  # next cell index per (cell index, action), or NO_CELL
+        self.valid_actions = np.zeros(self.maze.size, dtype=np.uint8)  # bit 'a' is set if action 'a' is possible
+        for action in self.actions:
+            self.valid_actions |= np.where(self.transitions[:, action] != NO_CELL, 1 << action, 0).astype(np.uint8)
+
+        # preallocated buffers for the observations, the second element is the cell which is marked in the buffer
+        if observation == "grid":
+            self.__buffers = [[self.maze.reshape((1, -1)).copy(), None] for _ in range(2)]
+        elif observation == "onehot":
+            self.__buffers = [[np.zeros((1, self.maze.size), dtype=np.int8), None] for _ in range(2)]
+        elif observation == "window":
+            self.__padded = np.pad(self.maze, window // 2, constant_values=CELL_OCCUPIED)
+        self.__next_buffer = 0
+
         self.reset(start_cell)
 
+    def __getstate__(self):
+        """ Leave out the executor and process pool when the maze is sent to another process. """
+        state = self.__dict__.copy()
+        state["executor"] = None
+        state["_Maze__pool"] = None
+        return state
+
+    def close(self):
+        """ Shut down the process pool win_all() created, if any. A new one is created when it is needed again. """
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
+
+    def cell_index(self, cell):
+        """ Convert a (col, row) cell to its index in the flattened maze (and in the transition table).
+
+            :param tuple cell: Cell as (col, row).
+            :return int: Cell index.
+        """
+        col, row = cell
+        return row * self.maze.shape[1] + col
+
+    def index_cell(self, index):
+        """ Convert an index in the flattened maze back to a (col, row) cell.
+
+            :param int index: Cell index.
+            :return tuple: Cell as (col, row).
+        """
+        row, col = divmod(int(index), self.maze.shape[1])
+        return col, row
+
+    def fingerprint(self):
+        """ Create a string which identifies the layout of the maze and its exit, e.g. to check that a saved model
+            belongs to this maze.
+
+            :return str: Hexadecimal hash.
+        """
+        h = hashlib.sha1()
+        h.update(repr((self.maze.shape, self.__exit_cell)).encode())
+        h.update(np.ascontiguousarray(self.maze, dtype=np.uint8).tobytes())
+        return h.hexdigest()
+
+    @property
+    def observation_size(self):
+        """ Number of values in a state, e.g. the size of the input layer of a network. """
+        return {"grid": self.maze.size, "cell": 1, "coordinates": 2, "onehot": self.maze.size,
+                "window": self.window * self.window}[self.observation]
+
+    def state_index(self, state):
+        """ Derive the index of the agents cell from a state.
+
+            :param numpy.array state: State as returned by reset() or step().
+            :return int: Cell index.
+        """
+        state = np.asarray(state).ravel()
+        if self.observation == "grid":
+            return int(np.argmax(state == CELL_CURRENT))
+        if self.observation == "cell":
+            return int(state[0])
+        if self.observation == "coordinates":
+            return self.cell_index(state)
+        if self.observation == "onehot":
+            return int(np.argmax(state))
+        raise Exception("Error: the agents cell cannot be derived from a {} observation".format(self.observation))
+
+    @property
+    def exit_cell(self):
+        """ The (col, row) cell the agent has to reach. """
+        return self.__exit_cell
+
     def reset(self, start_cell=(0, 0)):
         """ Reset the maze to its initial state and place the agent at start_cell.
 
             :param tuple start_cell: Here the agent starts its journey through the maze (optional, else upper left).
             :return: New state after reset.
         """
-        if start_cell not in self.cells:
-            raise Exception("Error: start cell at {} is not inside maze".format(start_cell))
-        if self.maze[start_cell[::-1]] == CELL_OCCUPIED:
-            raise Exception("Error: start cell at {} is not free".format(start_cell))
-        if start_cell == self.__exit_cell:
-            raise Exception("Error: start- and exit cell cannot be the same {}".format(start_cell))
+        check_cell(self.maze, start_cell, "start", self.__exit_cell)
 
         self.__previous_cell = self.__current_cell = start_cell
         self.__total_reward = 0.0  # accumulated reward
         self.__visited = set()  # a set only stores unique values
 
+        if self.recorder is not None:
+            self.recorder.start(self.cell_index(start_cell))
+
         if self.display:
             # render the maze
             nrows, ncols = self.maze.shape
@@ -112,11 +294,26 @@ class Maze:
             :param int action: The agent will move in this direction.
             :return: state, reward, status
         """
-        reward = self.__execute(action)
-        self.__total_reward += reward
-        status = self.__status()
-        state = self.__observe()
-        logging.debug("action: {:10s} | reward: {: .2f} | status: {}".format(actions[action], reward, status))
+        if self.writer is not None:
+            cell = self.cell_index(self.__current_cell)
+
+        with self.profiler.phase("execute"):
+            reward = self.__execute(action)
+            self.__total_reward += reward
+            status = self.__status()
+        with self.profiler.phase("observe"):
+            state = self.__observe()
+
+        if self.writer is not None:
+            self.writer.write(cell, action, reward, self.cell_index(self.__current_cell), status)
+
+        if self.recorder is not None:
+            self.recorder.add(self.cell_index(self.__current_cell))
+            if status != "playing":
+                self.recorder.end(status)
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("action: {:10s} | reward: {: .2f} | status: {}".format(actions[action], reward, status))
         return state, reward, status
 
     def __execute(self, action):
@@ -125,23 +322,14 @@ class Maze:
             :param int action: The agent will move in this direction.
             :return float: Reward or penalty after the action is done.
         """
-        possible_actions = self.__possible_actions(self.__current_cell)
+        current = self.cell_index(self.__current_cell)
+        next_cell = self.transitions[current, action]
 
-        if not possible_actions:
+        if self.valid_actions[current] == 0:
             reward = self.__minimum_reward - 1  # cannot move anywhere, force end of game
-        elif action in possible_actions:
-            col, row = self.__current_cell
-            if action == MOVE_LEFT:
-                col -= 1
-            elif action == MOVE_UP:
-                row -= 1
-            if action == MOVE_RIGHT:
-                col += 1
-            elif action == MOVE_DOWN:
-                row += 1
-
+        elif next_cell != NO_CELL:
             self.__previous_cell = self.__current_cell
-            self.__current_cell = (col, row)
+            self.__current_cell = self.index_cell(next_cell)
 
             if self.display:
                 self.__draw()
@@ -159,33 +347,6 @@ class Maze:
 
         return reward
 
-    def __possible_actions(self, cell=None):
-        """ Create a list with possible actions, avoiding the maze's edges and walls.
-
-            :param tuple cell: Location of the agent (optional, else current cell).
-            :return list: All possible actions.
-        """
-        if cell is None:
-            col, row = self.__current_cell
-        else:
-            col, row = cell
-
-        possible_actions = self.actions.copy()  # initially allow all
-
-        # now restrict the initial list by removing impossible actions
-        nrows, ncols = self.maze.shape
-        if row == 0 or (row > 0 and self.maze[row - 1, col] == CELL_OCCUPIED):
-            possible_actions.remove(MOVE_UP)
-        if row == nrows - 1 or (row < nrows - 1 and self.maze[row + 1, col] == CELL_OCCUPIED):
-            possible_actions.remove(MOVE_DOWN)
-
-        if col == 0 or (col > 0 and self.maze[row, col - 1] == CELL_OCCUPIED):
-            possible_actions.remove(MOVE_LEFT)
-        if col == ncols - 1 or (col < ncols - 1 and self.maze[row, col + 1] == CELL_OCCUPIED):
-            possible_actions.remove(MOVE_RIGHT)
-
-        return possible_actions
-
     def __status(self):
         """ Determine the game status.
 
@@ -199,15 +360,42 @@ class Maze:
 
         return "playing"
 
-    def __observe(self):
-        """ Create a [1][N] copy of the maze (N = total cell count in the maze), including the agents current location.
+    def __observe(self, cell=None):
+        """ Create the state for the agents current location, in the format selected by self.observation.
+
+            For mode "grid" this is a [1][N] copy of the maze (N = total cell count in the maze), including the agents
+            current location.
 
-            :return numpy.array [1][size]: Maze content as an array of 1*total_cells_in_array.
+            :param tuple cell: Location of the agent (optional, else current cell). States for other cells than the
+                               current one are never written into the buffers (see reuse_buffers).
+            :return numpy.array [1][observation_size]: The state.
         """
-        state = np.copy(self.maze)
-        col, row = self.__current_cell
-        state[row, col] = CELL_CURRENT  # indicate the agents current location
-        return state.reshape((1, -1))
+        col, row = self.__current_cell if cell is None else cell
+        index = row * self.maze.shape[1] + col
+
+        if self.observation == "cell":
+            return np.array([[index]])
+        if self.observation == "coordinates":
+            return np.array([[col, row]])
+        if self.observation == "window":
+            state = self.__padded[row:row + self.window, col:col + self.window].copy()
+            state[self.window // 2, self.window // 2] = CELL_CURRENT
+            return state.reshape((1, -1))
+
+        if cell is None and self.reuse_buffers:
+            buffer = self.__buffers[self.__next_buffer]
+            self.__next_buffer = 1 - self.__next_buffer
+            state, marked = buffer
+            if marked is not None:
+                state[0, marked] = self.maze.flat[marked] if self.observation == "grid" else 0  # erase previous
+            buffer[1] = index
+        elif self.observation == "grid":
+            state = self.maze.reshape((1, -1)).copy()
+        else:
+            state = np.zeros((1, self.maze.size), dtype=np.int8)
+
+        state[0, index] = CELL_CURRENT if self.observation == "grid" else 1  # indicate the agents current location
+        return state
 
     def play(self, model, start_cell=(0, 0)):
         """ Play a single game, choosing the next move based a prediction from 'model'.
@@ -216,9 +404,7 @@ class Maze:
             :param tuple start_cell: Agents initial cell (optional, else upper left).
             :return str: "win" or "lose"
         """
-        self.reset(start_cell)
-
-        state = self.__observe()
+        state = self.reset(start_cell)
 
         while True:
             action = model.predict(state=state)
@@ -226,29 +412,193 @@ class Maze:
             if status in ("win", "lose"):
                 return status
 
-    def win_all(self, model):
-        """ Check if the model wins from all possible starting cells. """
-        previous = self.display
+    def win_all(self, model, cells=None):
+        """ Check if the model wins from all possible starting cells.
+
+            If the model exposes its Q's the greedy policy is evaluated analytically (see __follow_policy()), else
+            a game is played from every starting cell.
+
+            :param class AbstractModel model: The prediction model to use.
+            :param list cells: Starting cells to check (optional, else all empty cells).
+            :return bool, float: True if all games are won, fraction of games won
+        """
+        cells = self.empty if cells is None else cells
+
+        previous = self.display, self.recorder, self.writer, self.profiler
         self.display = False  # never render moves during execution of win_all()
+        self.recorder = None  # nor record or log them
+        self.writer = None
+        self.profiler = NullProfiler()  # nor count them as training steps
+        profiler = previous[-1]
+
+        with profiler.phase("follow_policy"):
+            results = self.__follow_policy(model, cells)
+
+        if results is None:
+            with profiler.phase("rollout"):
+                win, lose = self.__rollout(model, cells)
+        else:
+            win, lose = results
+
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info("won: {} | lost: {} | win rate: {:.5f}".format(win, lose, win / (win + lose)))
 
-        # for i, cell in enumerate(self.empty):
-        #     if self.play(model, cell) == "lose":
-        #         self.display = previous
-        #         return False
-        # self.display = previous
-        # return True
+        self.display, self.recorder, self.writer, self.profiler = previous
+        result = True if lose == 0 else False
+        return result, win / (win + lose)
+
+    def __rollout(self, model, cells):
+        """ Play a game from every cell in 'cells' and count the results.
 
+            If self.workers > 1 the cells are split over the worker processes of self.executor, or else of a pool
+            which is created on the first call and reused by the next ones (see close()). Every worker receives a
+            copy of the maze and a snapshot of the model, so the model must be picklable.
+
+            :param class AbstractModel model: The prediction model to use.
+            :param list cells: Starting cells.
+            :return int, int: Number of games won, number of games lost
+        """
         win = 0
         lose = 0
 
-        for cell in self.empty:
+        if self.workers > 1 and len(cells) > 1:
+            workers = min(self.workers, len(cells))
+            chunks = [cells[i::workers] for i in range(workers)]
+            executor = self.executor
+            if executor is None:
+                if self.__pool is None or self.__pool_workers != self.workers:
+                    self.close()
+                    self.__pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self.__pool_workers = self.workers
+                executor = self.__pool
+            for w, l in executor.map(_play_games, [model] * workers, chunks):
+                win += w
+                lose += l
+            return win, lose
+
+        for cell in cells:
             if self.play(model, cell) == "win":
-                win +=1
+                win += 1
             else:
                 lose += 1
 
-        logging.info("won: {} | lost: {} | win rate: {:.5f}".format(win, lose, win / (win + lose)))
+        return win, lose
 
-        self.display = previous
-        result = True if lose == 0 else False
-        return result, win / (win + lose)
+    def __observe_cells(self, indices):
+        """ Create the states for an agent in each of the cells in 'indices' at once, see __observe().
+
+            :param numpy.array indices: Cell indices.
+            :return numpy.array [n][observation_size]: One state per cell.
+        """
+        rows, cols = np.divmod(indices, self.maze.shape[1])
+        n = len(indices)
+
+        if self.observation == "cell":
+            return indices.reshape((-1, 1))
+        if self.observation == "coordinates":
+            return np.stack((cols, rows), axis=1)
+        if self.observation == "window":
+            windows = np.lib.stride_tricks.sliding_window_view(self.__padded, (self.window, self.window))
+            states = windows[rows, cols].copy()
+            states[:, self.window // 2, self.window // 2] = CELL_CURRENT
+            return states.reshape((n, -1))
+        if self.observation == "grid":
+            states = np.tile(self.maze.reshape((1, -1)), (n, 1))
+            states[np.arange(n), indices] = CELL_CURRENT
+        else:
+            states = np.zeros((n, self.maze.size), dtype=np.int8)
+            states[np.arange(n), indices] = 1
+        return states
+
+    @staticmethod
+    def __greedy_actions(q):
+        """ Determine the action the model chooses per row of Q's.
+
+            :param numpy.array q: Q's [n][num_actions].
+            :return numpy.array [n]: Action, or NO_CELL if multiple actions have the same (max) Q.
+        """
+        q = np.asarray(q)
+        ties = np.count_nonzero(q == q.max(axis=1, keepdims=True), axis=1) > 1
+        # with ties the model chooses randomly, so the outcome is not known in advance
+        return np.where(ties, NO_CELL, q.argmax(axis=1))
+
+    def __greedy_action(self, model, index):
+        """ Determine the action the model chooses in a cell.
+
+            :param class AbstractModel model: The prediction model to use.
+            :param int index: Cell index.
+            :return int: Action, NO_CELL if multiple actions have the same (max) Q, or None if the model does not
+                         expose its Q's.
+        """
+        q = model.q(self.__observe(self.index_cell(index)))
+        if q is None:
+            return None
+        return self.__greedy_actions(np.reshape(q, (1, -1)))[0]
+
+    def __follow_policy(self, model, cells):
+        """ Determine the result of a game from every cell in 'cells' by following the models greedy policy.
+
+            The policy maps every cell onto exactly one next cell, so the games form a functional graph. A path which
+            reaches the exit is won; it never revisits a cell so the penalties stay above the minimum reward. A path
+            which returns to a cell on itself (a cycle, including bumping into a wall) never ends and is lost. Results
+            are memoized per cell, so every cell is visited only once. Games from cells whose path contains a cell
+            with a random (tied) choice are played for real. If the model can predict a batch of states at once
+            (see AbstractModel.q_batch()) the actions for all free cells are determined in a single call. Else the
+            action per cell is only determined for the cells on the paths, so checking a few starting cells is cheap.
+
+            :param class AbstractModel model: The prediction model to use.
+            :param list cells: Starting cells.
+            :return int, int: Number of games won, number of games lost, or None if the model does not expose its
+                              Q's
+        """
+        UNKNOWN, WIN, LOSE, RANDOM = 0, 1, 2, 3
+        UNSET = NO_CELL - 1
+
+        policy = np.full(self.maze.size, UNSET, dtype=np.int64)  # action per cell index, filled when needed
+
+        free = np.flatnonzero(self.maze.ravel() != CELL_OCCUPIED)
+        q = model.q_batch(self.__observe_cells(free))
+        if q is not None:
+            policy[free] = self.__greedy_actions(q)
+
+        outcome = np.zeros(self.maze.size, dtype=np.int8)
+        outcome[self.cell_index(self.__exit_cell)] = WIN
+
+        for cell in cells:
+            path = []
+            on_path = set()
+            current = self.cell_index(cell)
+
+            while outcome[current] == UNKNOWN:
+                if current in on_path:
+                    result = LOSE  # the agent walks in circles
+                    break
+                path.append(current)
+                on_path.add(current)
+
+                action = policy[current]
+                if action == UNSET:
+                    action = self.__greedy_action(model, current)
+                    if action is None:
+                        return None
+                    policy[current] = action
+                if action == NO_CELL:
+                    result = RANDOM
+                    break
+                next_cell = self.transitions[current, action]
+                if next_cell == NO_CELL:
+                    result = LOSE  # the agent keeps running into a wall
+                    break
+                current = next_cell
+            else:
+                result = outcome[current]
+
+            outcome[path] = result
+
+        results = outcome[[self.cell_index(cell) for cell in cells]]
+
+        win, lose = self.__rollout(model, [cell for cell, result in zip(cells, results) if result == RANDOM])
+        win += np.count_nonzero(results == WIN)
+        lose += np.count_nonzero(results == LOSE)
+
+        return int(win), int(lose)
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class TrajectoryRecorder:
+    """ Record the cells an agent visits, episode by episode, so the games can be rendered afterwards.
+
+        Attach a recorder to a maze via Maze.recorder. Every reset() starts a new episode and every step() appends
+        the agents cell (as index in the flattened maze) to a preallocated array which doubles in size when full.
+        This costs far less than drawing every move while playing (Maze.display). See environment.render for
+        turning the recorded episodes into images or animations.
+
+        :param int capacity: Initial number of steps which can be stored.
+    """
+
+    def __init__(self, capacity=4096):
+        self.cells = np.empty(capacity, dtype=np.int32)  # cells of all episodes, one after another
+        self.length = 0  # number of cells stored
+        self.starts = []  # position in self.cells where every episode starts
+        self.statuses = []  # final status of every episode ("playing" while not finished)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def start(self, cell):
+        """ Start a new episode in 'cell' (index). """
+        self.starts.append(self.length)
+        self.statuses.append("playing")
+        self.add(cell)
+
+    def add(self, cell):
+        """ Append the agents current cell (index) to the current episode. """
+        if self.length == self.cells.size:
+            self.cells = np.resize(self.cells, 2 * self.cells.size)
+        self.cells[self.length] = cell
+        self.length += 1
+
+    def end(self, status):
+        """ Register the outcome ("win" or "lose") of the current episode. """
+        self.statuses[-1] = status
+
+    def episode(self, i):
+        """ Return the cells visited in episode i (negative values count from the end).
+
+            :param int i: Episode number.
+            :return np.array: Cell indices, starting with the start cell.
+        """
+        i = range(len(self.starts))[i]
+        end = self.starts[i + 1] if i + 1 < len(self.starts) else self.length
+        return self.cells[self.starts[i]:end].copy()
+
+    def copy(self):
+        """ Return an independent copy of the recorded episodes. """
+        recorder = TrajectoryRecorder(capacity=max(1, self.length))
+        recorder.cells[:self.length] = self.cells[:self.length]
+        recorder.length = self.length
+        recorder.starts = list(self.starts)
+        recorder.statuses = list(self.statuses)
+        return recorder
+
+    def clear(self):
+        """ Forget all recorded episodes. """
+        self.length = 0
+        self.starts = []
+        self.statuses = []
@@ -0,0 +1,102 @@
+""" Render episodes recorded by a TrajectoryRecorder.
+
+    Uses matplotlib Figure objects directly instead of pyplot, so rendering can run in a background thread while
+    training continues.
+"""
+import threading
+
+import numpy as np
+from matplotlib.animation import FuncAnimation, PillowWriter
+from matplotlib.figure import Figure
+
+
+def _draw_maze(ax, game):
+    """ Draw the maze and its exit in the same style as Maze.display. """
+    nrows, ncols = game.maze.shape
+    ax.set_xticks(np.arange(0.5, ncols, step=1))
+    ax.set_xticklabels([])
+    ax.set_yticks(np.arange(0.5, nrows, step=1))
+    ax.set_yticklabels([])
+    ax.grid(True)
+    ax.plot(*game.exit_cell, "gs", markersize=25)  # exit is a big green square
+    ax.imshow(game.maze, cmap="binary")
+
+
+def plot_episode(game, cells, ax=None):
+    """ Draw the path of a single episode on top of the maze.
+
+        :param class Maze game: The maze the episode was played in.
+        :param np.array cells: Cell indices visited, as returned by TrajectoryRecorder.episode().
+        :param ax: Matplotlib axes to draw on (optional, else a new figure is created).
+        :return: The axes.
+    """
+    if ax is None:
+        ax = Figure().subplots()
+
+    rows, cols = np.divmod(cells, game.maze.shape[1])
+
+    _draw_maze(ax, game)
+    ax.plot(cols[0], rows[0], "rs", markersize=25)  # start is a big red square
+    ax.plot(cols, rows, "bo-")  # visited cells are blue dots
+    ax.plot(cols[-1], rows[-1], "ro")  # final cell is a red dot
+
+    return ax
+
+
+def save_paths(game, recorder, filename, episodes=None):
+    """ Save a static image with the path of every selected episode, one subplot per episode.
+
+        :param class Maze game: The maze the episodes were played in.
+        :param TrajectoryRecorder recorder: The recorded episodes.
+        :param str filename: Image file to write (e.g. .png).
+        :param list episodes: Episode numbers to draw (optional, else all).
+    """
+    episodes = range(len(recorder)) if episodes is None else episodes
+    paths = [(i, recorder.episode(i), recorder.statuses[i]) for i in episodes]
+
+    ncols = int(np.ceil(np.sqrt(len(paths))))
+    nrows = int(np.ceil(len(paths) / ncols))
+
+    figure = Figure(figsize=(3 * ncols, 3 * nrows))
+    for n, (i, cells, status) in enumerate(paths):
+        ax = figure.add_subplot(nrows, ncols, n + 1)
+        plot_episode(game, cells, ax)
+        ax.set_title("episode {}: {}".format(i, status))
+
+    figure.savefig(filename)
+
+
+def save_animation(game, recorder, filename, episodes=None, fps=10):
+    """ Save an animation (e.g. a .gif) which replays the selected episodes move by move.
+
+        :param class Maze game: The maze the episodes were played in.
+        :param TrajectoryRecorder recorder: The recorded episodes.
+        :param str filename: Animation file to write.
+        :param list episodes: Episode numbers to replay (optional, else all).
+        :param int fps: Frames (= moves) per second.
+    """
+    episodes = range(len(recorder)) if episodes is None else episodes
+    frames = [(i, cells, n) for i in episodes for cells in [recorder.episode(i)] for n in range(1, cells.size + 1)]
+
+    figure = Figure()
+    ax = figure.subplots()
+
+    def draw(frame):
+        i, cells, n = frame
+        ax.clear()
+        plot_episode(game, cells[:n], ax)
+        ax.set_title("episode {}".format(i))
+
+    FuncAnimation(figure, draw, frames=frames, cache_frame_data=False).save(filename, writer=PillowWriter(fps=fps))
+
+
+def render_in_background(function, game, recorder, filename, **kwargs):
+    """ Run save_paths() or save_animation() in a background thread.
+
+        The recorded episodes are copied first, so the recorder can keep recording while rendering.
+
+        :return threading.Thread: The rendering thread, use join() to wait for it to finish.
+    """
+    thread = threading.Thread(target=function, args=(game, recorder.copy(), filename), kwargs=kwargs)
+    thread.start()
+    return thread
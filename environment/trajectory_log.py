@@ -0,0 +1,124 @@
+""" Log game transitions to disk and read them back, e.g. to train models offline.
+
+    Every transition is stored as a fixed-width record (see RECORD) in a directory of append-only chunk files.
+    A chunk file contains nothing but records, so it can be memory mapped as a NumPy structured array. Data from
+    many training runs can be collected in one directory and used without loading it all into memory.
+"""
+import glob
+import os
+
+import numpy as np
+
+RECORD = np.dtype([
+    ("cell", "<i4"),  # index of the agents cell before the move
+    ("action", "i1"),
+    ("reward", "<f4"),
+    ("next_cell", "<i4"),  # index of the agents cell after the move
+    ("status", "i1")  # game status after the move, see STATUS
+])
+
+STATUS = {"playing": 0, "win": 1, "lose": 2}
+
+
+class TrajectoryWriter:
+    """ Buffer transitions in memory and append them to chunk files in 'directory'.
+
+        Attach a writer to a maze via Maze.writer to log every step, or call write() directly. Chunks are numbered
+        after the chunks already in the directory, so several runs can write to the same directory one after
+        another. Call close() (or use the writer as a context manager) to flush the last transitions.
+
+        :param str directory: Directory for the chunk files (created if it does not exist).
+        :param int chunk_size: Maximum number of records per chunk file.
+        :param int buffer_size: Number of records buffered in memory before they are written.
+    """
+
+    def __init__(self, directory, chunk_size=1 << 20, buffer_size=1 << 12):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.buffer = np.zeros(buffer_size, dtype=RECORD)
+        self.count = 0  # number of records in the buffer
+        self.chunk = len(_chunk_files(directory))  # number of the chunk file to write to
+        self.chunk_count = 0  # number of records in the current chunk file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, cell, action, reward, next_cell, status):
+        """ Add a single transition.
+
+            :param int cell: Index of the agents cell before the move.
+            :param int action: The action taken.
+            :param float reward: The reward received.
+            :param int next_cell: Index of the agents cell after the move.
+            :param str status: Game status after the move ("playing", "win" or "lose").
+        """
+        self.buffer[self.count] = (cell, action, reward, next_cell, STATUS[status])
+        self.count += 1
+        if self.count == self.buffer.size:
+            self.flush()
+
+    def flush(self):
+        """ Append the buffered records to the chunk files. """
+        written = 0
+        while written < self.count:
+            n = min(self.count - written, self.chunk_size - self.chunk_count)
+            with open(os.path.join(self.directory, "chunk-{:06d}.bin".format(self.chunk)), "ab") as outfile:
+                self.buffer[written:written + n].tofile(outfile)
+            written += n
+            self.chunk_count += n
+            if self.chunk_count == self.chunk_size:
+                self.chunk += 1
+                self.chunk_count = 0
+        self.count = 0
+
+    def close(self):
+        self.flush()
+
+
+class TrajectoryReader:
+    """ Read the transitions in a directory written by TrajectoryWriter, via memory mapped chunk files.
+
+        :param str directory: Directory with the chunk files.
+    """
+
+    def __init__(self, directory):
+        self.files = [f for f in _chunk_files(directory) if os.path.getsize(f) > 0]
+
+    def __len__(self):
+        return sum(os.path.getsize(f) // RECORD.itemsize for f in self.files)
+
+    def chunks(self):
+        """ Yield every chunk file as a read-only memory mapped array of records. """
+        for f in self.files:
+            yield np.memmap(f, dtype=RECORD, mode="r")
+
+    def batches(self, batch_size=1 << 16, shuffle=False):
+        """ Yield the transitions in batches of at most batch_size records. Batches never span two chunks.
+
+            :param int batch_size: Number of records per batch.
+            :param bool shuffle: Visit the chunks, and the records within a chunk, in random order.
+        """
+        order = np.random.permutation(len(self.files)) if shuffle else range(len(self.files))
+        for i in order:
+            chunk = np.memmap(self.files[i], dtype=RECORD, mode="r")
+            if shuffle:
+                index = np.random.permutation(chunk.size)
+                for start in range(0, chunk.size, batch_size):
+                    yield chunk[np.sort(index[start:start + batch_size])]
+            else:
+                for start in range(0, chunk.size, batch_size):
+                    yield chunk[start:start + batch_size]
+
+    def read(self):
+        """ Return all transitions as a single in-memory array of records. """
+        if not self.files:
+            return np.zeros(0, dtype=RECORD)
+        return np.concatenate(list(self.chunks()))
+
+
+def _chunk_files(directory):
+    return sorted(glob.glob(os.path.join(directory, "chunk-*.bin")))
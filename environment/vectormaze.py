@@ -0,0 +1,126 @@
+import numpy as np
+
+from environment.maze import CELL_CURRENT, CELL_EMPTY, MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT, MOVE_UP, NO_CELL, \
+    build_transitions, check_cell
+
+
+class VectorMaze:
+    """ A batch of independent agents, each moving through its own copy of the same maze.
+
+        The rules are identical to those of class Maze (see there), but instead of one agent there are N agents
+        whose cells, visited cells and accumulated rewards are stored as NumPy arrays. A single call to step()
+        moves all agents at once, so the per-step cost is a handful of array operations instead of N rounds of
+        Python code. Agents which win or lose are automatically placed at a new start cell (auto-reset).
+
+        Cells are identified by their index in the flattened maze (index = row * ncols + col), which is also the
+        position of the agent in the [1][size] state vector produced by Maze. The states returned by reset() and
+        step() are these cell indices. Visited cells are marked with the episode number of the agent, so placing
+        an agent at a new start cell does not need to clear its row; a step costs O(n) regardless of the size of
+        the maze. Method grids() builds the complete maze states (as in Maze observation mode "grid") for the
+        agents which need them.
+    """
+
+    def __init__(self, maze, n, start_cell=None, exit_cell=None, auto_reset=True):
+        """ Create N agents in a maze with a specific start- and exit-cell.
+
+            :param numpy.array maze: 2D Array containing empty cells (=0) and cells occupied with walls (=1).
+            :param int n: Number of agents.
+            :param tuple start_cell: Starting cell for all agents (optional, else a random empty cell per agent).
+            :param tuple exit_cell: Exit cell which the agents have to reach (optional, else lower right).
+            :param bool auto_reset: Place agents at a new start cell as soon as their game ends.
+        """
+        self.maze = maze
+        self.n = n
+        self.auto_reset = auto_reset
+        self.actions = [MOVE_LEFT, MOVE_RIGHT, MOVE_UP, MOVE_DOWN]
+        self.__minimum_reward = -0.5 * self.maze.size  # stop game if accumulated reward is below this threshold
+
+        nrows, ncols = self.maze.shape
+        exit_cell = (ncols - 1, nrows - 1) if exit_cell is None else exit_cell
+
+        check_cell(self.maze, exit_cell, "exit")
+        if start_cell is not None:
+            check_cell(self.maze, start_cell, "start", exit_cell)
+
+        self.__exit = exit_cell[1] * ncols + exit_cell[0]
+        self.__start = None if start_cell is None else start_cell[1] * ncols + start_cell[0]
+
+        self.__grid = self.maze.flatten()
+        self.empty = np.flatnonzero(self.__grid == CELL_EMPTY)
+        self.empty = self.empty[self.empty != self.__exit]  # the exit cannot be used as a start cell
+
+        self.__transitions = build_transitions(self.maze)
+        self.__stuck = np.all(self.__transitions == NO_CELL, axis=1)  # cells from which the agent cannot move anywhere
+
+        self.cells = np.zeros(n, dtype=np.int64)  # current cell of every agent
+        self.total_rewards = np.zeros(n, dtype=float)  # accumulated reward of every agent
+        self.episodes = np.zeros(n, dtype=np.uint16)  # number of games started by every agent (wraps around)
+        self.visited = np.zeros((n, self.maze.size), dtype=np.uint16)  # episode in which an agent last visited a cell
+
+        self.reset()
+
+    def reset(self, mask=None):
+        """ Place (a selection of) the agents at a start cell and clear their history.
+
+            :param numpy.array mask: Boolean array selecting the agents to reset (optional, else all).
+            :return numpy.array [n]: New states (cell indices) after reset.
+        """
+        idx = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        if idx.size:
+            if self.__start is None:
+                self.cells[idx] = np.random.choice(self.empty, idx.size)
+            else:
+                self.cells[idx] = self.__start
+            self.total_rewards[idx] = 0.0
+            self.episodes[idx] += 1  # cells visited in earlier episodes no longer count as visited
+            wrapped = idx[self.episodes[idx] == 0]  # the numbers start over, once every 65536 games clear the row
+            self.visited[wrapped] = 0
+            self.episodes[wrapped] = 1
+
+        return self.cells.copy()
+
+    def step(self, actions):
+        """ Move every agent according to its action and return the new states, rewards and game statuses.
+
+            :param numpy.array actions: One action per agent.
+            :return: states [n] (cell indices), rewards [n], statuses [n] ("win"/"lose"/"playing")
+        """
+        actions = np.asarray(actions)
+        agents = np.arange(self.n)
+
+        current = self.cells
+        target = self.__transitions[current, actions]
+        moved = target != NO_CELL
+
+        rewards = np.full(self.n, -0.75)  # penalty for trying to enter an occupied cell or moving out of the maze
+        cells = np.where(moved, target, current)
+        revisit = self.visited[agents, cells] == self.episodes
+        rewards[moved] = np.where(revisit[moved], -0.25, -0.04)
+        rewards[moved & (cells == self.__exit)] = 1.0
+        rewards[self.__stuck[current]] = self.__minimum_reward - 1  # cannot move anywhere, force end of game
+
+        self.visited[agents[moved], cells[moved]] = self.episodes[moved]
+        self.cells = cells
+        self.total_rewards += rewards
+
+        win = self.cells == self.__exit
+        lose = ~win & (self.total_rewards < self.__minimum_reward)
+        statuses = np.where(win, "win", np.where(lose, "lose", "playing"))
+
+        if self.auto_reset:
+            states = self.reset(win | lose)
+        else:
+            states = self.cells.copy()
+
+        return states, rewards, statuses
+
+    def grids(self, agents=None):
+        """ Build the complete maze state for (a selection of) the agents, with their current cell marked.
+
+            :param numpy.array agents: Indices or boolean mask of the agents (optional, else all).
+            :return numpy.array [k][size]: One state per selected agent, as Maze returns in observation mode "grid".
+        """
+        cells = self.cells if agents is None else self.cells[agents]
+        states = np.tile(self.__grid, (cells.size, 1))
+        states[np.arange(cells.size), cells] = CELL_CURRENT
+        return states
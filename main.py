@@ -1,6 +1,9 @@
+import logging
+
 import matplotlib.pyplot as plt
+import numpy as np
 
-from environment import Maze
+from environment import Maze, TrajectoryRecorder
 from models import *
 
 logging.basicConfig(level=logging.INFO,
@@ -32,6 +35,15 @@ if 0:  # train using tabular Q-learning
     model = QTableModel(game)
     h, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=10000)
 
+if 0:  # train using tabular Q-learning with 4 processes updating one shared Q-table
+    model = QTableModel(game)
+    h, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=10000, workers=4)
+
+if 0:  # train using tabular Q-learning, evaluate at most 5% of the training time and stop at a 95% win rate
+    model = QTableModel(game)
+    h, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=10000,
+                          evaluator=Evaluator(target=0.95, budget=0.05))
+
 if 0:  # train using SARSA table
     model = SarsaTableModel(game)
     h, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=10000)
@@ -41,6 +53,33 @@ if 1:  # train using a tabular Q-learning and eligibility trace (aka TD-lamba)
     model = QTableTraceModel(game)
     h, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=10000)
 
+if 0:  # record the moves during training at full speed and render them afterwards
+    from environment import render
+
+    game.recorder = TrajectoryRecorder()
+    model = QTableTraceModel(game)
+    h, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=10000)
+    render.save_paths(game, game.recorder, "paths.png", episodes=range(-16, 0))  # the last 16 episodes
+    render.render_in_background(render.save_animation, game, game.recorder, "training.gif", episodes=[0, -1])
+
+if 0:  # log the transitions while training online, then learn a Q-table offline from the log
+    from environment import TrajectoryWriter
+
+    with TrajectoryWriter("transitions") as game.writer:
+        SarsaTableModel(game).train(discount=0.90, exploration_rate=0.50, learning_rate=0.10, episodes=1000)
+    game.writer = None
+    model = OfflineQTableModel(game)
+    model.train(transitions="transitions", discount=0.90)
+
+if 0:  # show where the training time goes, and which functions take the most time when updating the Q's
+    from profiling import Profiler
+
+    game.profiler = Profiler("profile.json")  # timings per phase are logged and written here after training
+    stats = game.profiler.attach_cprofile("update")
+    model = QTableTraceModel(game)
+    h, _, _ = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=10000)
+    stats.print_stats("cumulative")
+
 if 0:  # train using a simple neural network
     model = QNetworkModel(game)
     h, _, _ = model.train(discount=0.90, exploration_rate=0.10, episodes=10000)
@@ -49,9 +88,23 @@ if 0:  # train using a neural network with experience replay (also saves the res
     model = QReplayNetworkModel(game)
     h, _, _ = model.train(discount=0.90, exploration_rate=0.10, episodes=maze.size * 100, max_memory=maze.size * 8)
 
+if 0:  # same, but prioritize replays and calculate targets with a slowly following Double DQN target network
+    model = QReplayNetworkModel(game)
+    h, _, _ = model.train(discount=0.90, exploration_rate=0.10, episodes=maze.size * 100, max_memory=maze.size * 8,
+                          prioritized=True, double=True, tau=0.01)
+
+if 0:  # same, but let 4 processes play the games while this process only learns
+    model = QReplayNetworkModel(game)
+    h, _, _ = model.train(discount=0.90, exploration_rate=0.10, episodes=maze.size * 100, max_memory=maze.size * 8,
+                          actors=4)
+
+if 0:  # calculate the Q's directly from the known maze using value iteration (reference for the other models)
+    model = ValueIterationModel(game)
+    model.train(discount=0.90)
+
 try:
     plt.clf()
-    plt.plot(h)
+    plt.plot(h.win_rates)
     plt.xlabel("time")
     plt.ylabel("win rate")
     plt.show()
@@ -61,57 +114,18 @@ except NameError:
 if 0:  # load a previously trained model
     model = QReplayNetworkModel(game, load=True)
 
-if 0:  # log the average training time per model (takes a few hours)
-    """ Run a number of training episodes and plot the results in histograms. Time consuming. """
-    runs = 50
-
-    epi = list()
-    nme = list()
-    sec = list()
-
-    models = [0, 1, 2, 3, 4]
-
-    for model_id in models:
-        episodes = list()
-        seconds = list()
+if 0:  # log the average training time per model (takes a while, the runs are spread over all cpu's)
+    """ Run a number of training episodes and plot the results in histograms. Time consuming.
 
-        logging.disable(logging.WARNING)
-        for r in range(runs):
-            if model_id == 0:
-                model = QTableModel(game, name="QTableModel")
-            elif model_id == 1:
-                model = SarsaTableModel(game, name="SarsaTableModel")
-            elif model_id == 2:
-                model = QTableTraceModel(game, name="QTableTraceModel")
-            elif model_id == 3:
-                model = QNetworkModel(game, name="QNetworkModel")
-            elif model_id == 4:
-                model = QReplayNetworkModel(game, name="QReplayNetworkModel")
+        From the command line: python -m benchmark run --runs 50 --output benchmark.csv
+                               python -m benchmark plot benchmark.csv
+    """
+    import benchmark
 
-            _, e, s = model.train(discount=0.90, exploration_rate=0.10, learning_rate=0.10, episodes=10000)
-            episodes.append(e)
-            seconds.append(s.seconds)
-
-        logging.disable(logging.NOTSET)
-        logging.info("model: {} | trained {} times | average no of episodes: {}| average training time {}"
-                     .format(model.name, runs, np.average(episodes), np.sum(seconds) / len(seconds)))
-
-        epi.append(episodes)
-        sec.append(seconds)
-        nme.append(model.name)
-
-    f, (epi_ax, sec_ax) = plt.subplots(2, len(models), sharex="row", sharey="row", tight_layout=True)
-
-    for i in range(len(epi)):
-        epi_ax[i].set_title(nme[i])
-        epi_ax[i].set_xlabel("training episodes")
-        epi_ax[i].hist(epi[i], edgecolor="black")
-
-    for i in range(len(sec)):
-        sec_ax[i].set_xlabel("seconds per episode")
-        sec_ax[i].hist(sec[i], edgecolor="black")
-
-    plt.show()
+    results = benchmark.run_all(benchmark.MODELS, maze, runs=50,
+                                hyperparameters=dict(discount=0.90, exploration_rate=0.10, learning_rate=0.10,
+                                                     episodes=10000))
+    benchmark.plot(results)
 
 game.display = True
 game.play(model, start_cell=(0, 0))
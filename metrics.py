@@ -0,0 +1,168 @@
+""" Collect training metrics per episode without paying for logging while training.
+
+    Every train() of an episode based model records the episode number, game status, loss, total wins,
+    exploration rate and win rate (of a full check, or estimated from a sample) in a Metrics object. Rows are
+    stored in a preallocated NumPy array; only every flush_interval episodes the new rows are passed to the
+    sinks, which e.g. log or write them to a CSV file. A log sink checks once per flush whether its level is
+    enabled, so disabling logging really costs nothing.
+
+    Usage:
+        metrics = Metrics(sinks=[LogSink(), CSVSink("training.csv")], flush_interval=50)
+        metrics, episodes, seconds = model.train(metrics=metrics)
+        plt.plot(metrics.episodes, metrics["win_rate"])
+"""
+import csv
+import logging
+
+import numpy as np
+
+from environment.trajectory_log import STATUS
+
+RECORD = np.dtype([
+    ("episode", "<i4"),
+    ("status", "i1"),  # see STATUS
+    ("loss", "<f4"),  # NaN if the model has no loss
+    ("wins", "<i4"),  # total number of games won so far
+    ("exploration_rate", "<f4"),
+    ("win_rate", "<f4"),  # NaN if the model was not checked from all starting cells after this episode
+    ("sample_win_rate", "<f4")  # NaN if the model was not evaluated on a sample of the starting cells only
+])
+
+STATUSES = {code: status for status, code in STATUS.items()}
+
+
+class Metrics:
+    """ History of a training run, one row per (sampled) episode.
+
+        :param list sinks: Objects with a write(rows) method which receive the rows at every flush (optional, else
+                           a LogSink). Use an empty list to keep the rows in memory only.
+        :param int sample_interval: Keep one in every sample_interval episodes. Episodes after which the model
+                                    was evaluated are always kept.
+        :param int flush_interval: Pass new rows to the sinks after this number of rows.
+        :param int capacity: Initial number of rows, doubles when full.
+    """
+
+    def __init__(self, sinks=None, sample_interval=1, flush_interval=100, capacity=1024):
+        self.sinks = [LogSink()] if sinks is None else sinks
+        self.sample_interval = sample_interval
+        self.flush_interval = flush_interval
+        self.data = np.zeros(capacity, dtype=RECORD)
+        self.length = 0  # number of rows kept
+        self.flushed = 0  # number of rows passed to the sinks
+        self.current = False  # is row self.length the current episode, which is not kept (yet)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, field):
+        """ Return a column, e.g. metrics["win_rate"]. """
+        return self.data[field][:self.length]
+
+    @property
+    def episodes(self):
+        return self["episode"]
+
+    @property
+    def win_rates(self):
+        """ The win rate after every full check (what train() used to return as history). """
+        win_rate = self["win_rate"]
+        return win_rate[~np.isnan(win_rate)]
+
+    def record(self, episode, status, wins, exploration_rate=np.nan, loss=np.nan):
+        """ Record the outcome of an episode. Call record_win_rate() afterwards if the model was evaluated.
+
+            :param int episode: Episode number.
+            :param str status: Final status of the game ("win" or "lose").
+            :param int wins: Total number of games won so far.
+            :param float exploration_rate: Exploration rate used in this episode.
+            :param float loss: Loss of this episode (only for models with a loss).
+        """
+        if self.length - self.flushed >= self.flush_interval:
+            self.flush()
+        if self.length == self.data.size:
+            self.data = np.resize(self.data, 2 * self.data.size)
+
+        self.data[self.length] = (episode, STATUS[status], loss, wins, exploration_rate, np.nan, np.nan)
+
+        if episode % self.sample_interval == 0:
+            self.length += 1
+            self.current = False
+        else:
+            self.current = True
+
+    def record_win_rate(self, win_rate, full=True):
+        """ Add the win rate after evaluating the model to the last recorded episode.
+
+            :param float win_rate: Win rate.
+            :param bool full: The win rate is that of a check from all starting cells, else it is estimated from a
+                              sample of them (see Evaluator) and stored in column sample_win_rate.
+        """
+        if self.current:  # not sampled, keep it anyway
+            self.length += 1
+            self.current = False
+        self.data["win_rate" if full else "sample_win_rate"][self.length - 1] = win_rate
+
+    def flush(self):
+        """ Pass all rows not yet passed to the sinks. """
+        if self.flushed < self.length:
+            rows = self.data[self.flushed:self.length]
+            for sink in self.sinks:
+                sink.write(rows)
+            self.flushed = self.length
+
+
+class LogSink:
+    """ Log every row, formatting them only if the level is enabled.
+
+        :param int level: Logging level.
+    """
+
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def write(self, rows):
+        logger = logging.getLogger()
+        if not logger.isEnabledFor(self.level):
+            return
+        for row in rows:
+            message = "episode: {:d} | status: {:4s}".format(row["episode"], STATUSES[row["status"]])
+            if not np.isnan(row["loss"]):
+                message += " | loss: {:.4f}".format(row["loss"])
+            message += " | total wins: {:d} | e: {:.5f}".format(row["wins"], row["exploration_rate"])
+            if not np.isnan(row["win_rate"]):
+                message += " | win rate: {:.5f}".format(row["win_rate"])
+            if not np.isnan(row["sample_win_rate"]):
+                message += " | sample win rate: {:.5f}".format(row["sample_win_rate"])
+            logger.log(self.level, message)
+
+
+class CSVSink:
+    """ Write the rows to a CSV file, with status as text. The file is created (or emptied) immediately.
+
+        :param str filename: CSV file to write.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "w", newline="") as outfile:
+            csv.writer(outfile).writerow(RECORD.names)
+
+    def write(self, rows):
+        with open(self.filename, "a", newline="") as outfile:
+            writer = csv.writer(outfile)
+            for row in rows:  # numpy scalars, so float32 values are written as short as possible
+                writer.writerow([row["episode"], STATUSES[row["status"]]] + [row[name] for name in RECORD.names[2:]])
+
+
+class MemorySink:
+    """ Collect the rows of one or more training runs, e.g. to compare runs afterwards. """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, rows):
+        self.chunks.append(rows.copy())
+
+    def rows(self):
+        """ Return all rows collected so far as a single array. """
+        return np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=RECORD)
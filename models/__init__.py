@@ -1,7 +1,48 @@
+""" Prediction models.
+
+    Models are looked up by name with get(), or as attributes of this package. The module containing a model is
+    only imported when the model is used for the first time, so using a table based model never imports the
+    modules (and dependencies) of the network models.
+"""
+import importlib
+
 from .abstractmodel import *
-from .qnetwork import *
-from .qrandom import *
-from .qreplaynetwork import *
-from .qtable import *
-from .qtable_with_eligibility_trace import *
-from .sarsa import *
\ No newline at end of file
+
+# model name -> module in this package which defines it
+registry = {
+    "RandomModel": ".qrandom",
+    "QTableModel": ".qtable",
+    "OfflineQTableModel": ".qtable_offline",
+    "SarsaTableModel": ".sarsa",
+    "QTableTraceModel": ".qtable_with_eligibility_trace",
+    "QNetworkModel": ".qnetwork",
+    "QReplayNetworkModel": ".qreplaynetwork",
+    "ExperienceReplay": ".qreplaynetwork",
+    "PrioritizedExperienceReplay": ".qreplaynetwork",
+    "Evaluator": ".evaluator",
+    "ValueIterationModel": ".value_iteration",
+    "PolicyIterationModel": ".value_iteration",
+    "QTable": ".table"
+}
+
+__all__ = ["AbstractModel", "get"] + list(registry)
+
+
+def get(name):
+    """ Return the class called 'name', importing the module which defines it if necessary.
+
+        :param str name: Name of the model class, e.g. "QTableTraceModel".
+        :return class: The model class.
+    """
+    if name not in registry:
+        raise Exception("Error: unknown model {}".format(name))
+    cls = getattr(importlib.import_module(registry[name], __name__), name)
+    globals()[name] = cls  # next lookups do not pass __getattr__ anymore
+    return cls
+
+
+def __getattr__(name):
+    """ Import models on first attribute access, also when using 'from models import *'. """
+    if name in registry:
+        return get(name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -20,6 +20,16 @@ class AbstractModel(ABC):
         """ Train model. """
         pass
 
+    def q(self, state):
+        """ Return the Q's for all actions in state, or None if the model does not use Q's. """
+        return None
+
+    def q_batch(self, states):
+        """ Return the Q's for a batch of states [n][num_actions] in one call, or None if the model does not support
+            this (then q() is called per state).
+        """
+        return None
+
     @abstractmethod
     def predict(self, state):
         """ Predict value based on state. """
@@ -0,0 +1,235 @@
+""" Actor/learner training for QReplayNetworkModel.
+
+    Several actor processes each play games in their own copy of the maze, choosing moves with their own copy of
+    the network. Every finished game is sent to the learner (the process which called train()) through a queue.
+    The learner stores the games in its experience replay memory and fits the network continuously, on average
+    replay_ratio times per transition received, as often as when playing and learning in turns. Every
+    sync_interval fits it publishes the weights in shared memory; actors pick up the new weights before their next
+    game. So playing is spread over all cores instead of waiting for every fit.
+
+    Actors always use a NumpyNetwork, also when the learner uses Keras, as both have the same weight layout.
+"""
+import multiprocessing
+import queue
+import random
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from models.network import NumpyNetwork
+from profiling import NullProfiler
+
+
+def _actor(game, layers, shm_name, shapes, version, lock, transitions, stop, exploration_rate):
+    """ Play games and send them to the learner until 'stop' is set. Runs in an actor process.
+
+        :param class Maze game: Copy of the maze to play in.
+        :param list layers: Number of units per network layer.
+        :param str shm_name: Name of the shared memory block with the weights.
+        :param list shapes: Shape of every weight array.
+        :param version: Shared counter, increased by the learner after publishing new weights.
+        :param lock: Lock which guards the weights and version.
+        :param transitions: Queue to put the games in.
+        :param stop: Event which is set when training has finished.
+        :param float exploration_rate: (epsilon) 0 = preference for exploring (0 = not at all, 1 = only)
+    """
+    random.seed()  # actor processes inherit the random state of the parent, so reseed
+    np.random.seed()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    weights = np.ndarray(sum(int(np.prod(shape)) for shape in shapes), dtype=np.float32, buffer=shm.buf)
+    network = NumpyNetwork(layers)
+    current = -1  # version of the weights in use
+    start_list = list()  # starting cells not yet used
+
+    try:
+        while not stop.is_set():
+            if version.value != current:
+                with lock:
+                    current = version.value
+                    network.set_weights(_unflatten(weights, shapes))
+
+            if not start_list:
+                start_list = game.empty.copy()
+            start_cell = start_list.pop(random.randrange(len(start_list)))
+
+            state = game.reset(start_cell)
+            states, actions, rewards, next_states = [], [], [], []
+
+            while True:
+                if np.random.random() < exploration_rate:
+                    action = random.choice(game.actions)
+                else:
+                    q = network.predict(state)[0]
+                    action = random.choice(np.nonzero(q == np.amax(q))[0])
+
+                next_state, reward, status = game.step(action)
+
+                states.append(state.copy())  # the maze may reuse the arrays of its states, see Maze
+                actions.append(action)
+                rewards.append(reward)
+                next_states.append(next_state.copy())
+
+                if status in ("win", "lose"):
+                    break
+
+                state = next_state
+
+            game_record = (np.concatenate(states), np.array(actions, dtype=np.int8),
+                           np.array(rewards, dtype=np.float32), np.concatenate(next_states), status)
+            while not stop.is_set():
+                try:
+                    transitions.put(game_record, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+    finally:
+        del weights  # release the buffer before closing the shared memory
+        shm.close()
+
+
+def _flatten(weights):
+    return np.concatenate([np.ravel(w) for w in weights]).astype(np.float32)
+
+
+def _unflatten(flat, shapes):
+    weights = []
+    start = 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        weights.append(flat[start:start + size].reshape(shape).copy())
+        start += size
+    return weights
+
+
+def _get(transitions, processes):
+    """ Wait for the next game from the actors. """
+    while True:
+        try:
+            return transitions.get(timeout=1.0)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                raise Exception("Error: all actors have stopped")
+
+
+def train_actor_learner(model, experience, actors, episodes, exploration_rate, sample_size, sync_interval,
+                        replay_ratio, target_model, profiler, hist, evaluator):
+    """ Train model.model with games played by actor processes. See the module docstring.
+
+        :param class QReplayNetworkModel model: The model to train.
+        :param ExperienceReplay experience: Replay memory of the learner.
+        :param int actors: Number of actor processes.
+        :param int episodes: Number of games to learn from.
+        :param float exploration_rate: (epsilon) 0 = preference for exploring (0 = not at all, 1 = only)
+        :param int sample_size: Number of samples to replay per fit.
+        :param int sync_interval: Number of fits between publishing the weights to the actors.
+        :param float replay_ratio: Number of fits per transition received. Actors wait when the learner lags, so
+                                   this also limits how far the actors are ahead.
+        :param TargetNetwork target_model: Target network to update after every fit, or None.
+        :param Profiler profiler: Times the phases of training.
+        :param Metrics hist: Collects the history of training.
+        :param Evaluator evaluator: Decides when to check the win rate and when to stop.
+        :return int: Number of games learned from.
+    """
+    network = model.model
+    shapes = [np.shape(w) for w in network.get_weights()]
+    flat = _flatten(network.get_weights())
+
+    context = multiprocessing.get_context()
+    shm = shared_memory.SharedMemory(create=True, size=flat.nbytes)
+    weights = np.ndarray(flat.size, dtype=np.float32, buffer=shm.buf)
+    weights[:] = flat
+    version = context.Value("i", 0, lock=False)
+    lock = context.Lock()
+    transitions = context.Queue(maxsize=4 * actors)
+    stop = context.Event()
+
+    game = model.environment
+    previous = game.display, game.recorder, game.writer, game.profiler
+    game.display = False  # actors neither render, record nor log their moves
+    game.recorder = None
+    game.writer = None
+    game.profiler = NullProfiler()
+
+    processes = [context.Process(target=_actor, args=(game, network.layers, shm.name, shapes, version, lock,
+                                                      transitions, stop, exploration_rate), daemon=True)
+                 for _ in range(actors)]
+    for process in processes:
+        process.start()
+
+    game.display, game.recorder, game.writer, game.profiler = previous
+
+    episode = 0
+    wins = 0
+    steps = 0  # number of transitions received
+    fits = 0
+    loss = 0.0
+
+    try:
+        while episode < episodes - 1:
+            if fits < replay_ratio * steps:
+                with profiler.phase("sample"):
+                    inputs, targets, sample_weights = experience.get_samples(sample_size=sample_size)
+
+                with profiler.phase("fit"):
+                    network.fit(inputs, targets, epochs=4, batch_size=16, verbose=0, sample_weight=sample_weights)
+                    if target_model is not None:
+                        target_model.step()
+
+                with profiler.phase("loss"):
+                    loss += network.evaluate(inputs, targets, verbose=0, sample_weight=sample_weights)
+
+                fits += 1
+                if fits % sync_interval == 0:
+                    with profiler.phase("publish"):
+                        with lock:
+                            weights[:] = _flatten(network.get_weights())
+                            version.value += 1
+                continue
+
+            # learned enough from the games so far, take in the games which have arrived (at least one)
+            with profiler.phase("receive"):
+                received = [_get(transitions, processes)]
+                try:
+                    while len(received) < actors:
+                        received.append(transitions.get_nowait())
+                except queue.Empty:
+                    pass
+
+            stop_training = False
+            for states, actions, rewards, next_states, status in received:
+                steps += len(actions)
+                with profiler.phase("remember"):
+                    for i in range(len(actions)):
+                        experience.remember([states[i], actions[i], rewards[i], next_states[i],
+                                             status if i == len(actions) - 1 else "playing"])
+
+                episode += 1
+                if status == "win":
+                    wins += 1
+                hist.record(episode, status, wins, exploration_rate, loss)
+
+                if evaluator.due(episode):
+                    with profiler.phase("win_all"):
+                        stop_training, win_rate, full = evaluator.evaluate(model, episode)
+                    hist.record_win_rate(win_rate, full)
+                if stop_training or episode == episodes - 1:
+                    break
+
+            loss = 0.0
+            if stop_training:
+                break
+    finally:
+        stop.set()
+        for process in processes:  # keep emptying the queue so no actor blocks on a full queue
+            while process.is_alive():
+                try:
+                    transitions.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            process.join()
+        del weights
+        shm.close()
+        shm.unlink()
+
+    return episode
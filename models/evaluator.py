@@ -0,0 +1,104 @@
+import logging
+import math
+import random
+import time
+
+
+class Evaluator:
+    """ Decide when to evaluate a model during training, and when training can stop.
+
+        With a fixed schedule the model is checked from all starting cells every 'interval' episodes. With an
+        adaptive schedule the interval depends on the last win rate: long (max_interval) while the win rate is low,
+        short (min_interval) when it approaches the target. If a time budget is given the interval is also stretched
+        so evaluation takes at most that fraction of the training time.
+
+        If 'sample_size' is set, a random subset of the starting cells is checked first. Only if the model reaches
+        the target on this sample, a full check over all starting cells follows. Training stops when a full check
+        reaches the target win rate.
+
+        Evaluator(adaptive=False, sample_size=0) checks from all starting cells every 5 episodes.
+
+        :param int interval: Number of episodes between evaluations (the first one, if adaptive).
+        :param bool adaptive: Adapt the interval to the win rate.
+        :param int min_interval: Shortest interval if adaptive.
+        :param int max_interval: Longest interval if adaptive, or when stretched by the budget.
+        :param float sample_size: Fraction of the starting cells in a sample (0 = always check all cells).
+        :param float target: Win rate at which training stops (1 = win from all starting cells).
+        :param float budget: Maximum fraction of the training time spent evaluating (optional, else no maximum).
+    """
+
+    def __init__(self, interval=5, adaptive=True, min_interval=1, max_interval=25, sample_size=0.2, target=1.0,
+                 budget=None):
+        self.interval = interval
+        self.adaptive = adaptive
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.sample_size = sample_size
+        self.target = target
+        self.budget = budget
+        self.reset()
+
+    def reset(self):
+        """ Restart the schedule, call this at the start of training. """
+        self.next_episode = self.interval  # first episode to evaluate after
+        self.last_episode = 0
+        self.last_time = time.perf_counter()
+        self.evaluations = 0  # number of evaluations, full checks and samples
+        self.full_checks = 0  # number of evaluations from all starting cells
+        self.seconds = 0.0  # total time spent evaluating
+
+    def due(self, episode):
+        """ Return True if the model should be evaluated after 'episode'. """
+        return episode >= self.next_episode
+
+    def evaluate(self, model, episode):
+        """ Evaluate the model and schedule the next evaluation.
+
+            :param class AbstractModel model: The model to evaluate, on the maze it trains on.
+            :param int episode: The episode after which the model is evaluated.
+            :return bool, float, bool: True if training can stop, win rate, True if the win rate is that of a full
+                                       check (else it is the estimate from a sample)
+        """
+        start_time = time.perf_counter()
+        game = model.environment
+
+        stop = False
+        full = True
+        n = math.ceil(self.sample_size * len(game.empty))
+        if 0 < n < len(game.empty):
+            _, win_rate = game.win_all(model, random.sample(game.empty, n))
+            if win_rate >= self.target:  # confirm with a full check
+                _, win_rate = game.win_all(model)
+                self.full_checks += 1
+                stop = win_rate >= self.target
+            else:
+                full = False
+        else:
+            _, win_rate = game.win_all(model)
+            self.full_checks += 1
+            stop = win_rate >= self.target
+
+        end_time = time.perf_counter()
+        self.evaluations += 1
+        self.seconds += end_time - start_time
+
+        interval = self.interval
+        if self.adaptive:
+            progress = min(1.0, win_rate / self.target) if self.target > 0 else 1.0
+            interval = round(self.max_interval - (self.max_interval - self.min_interval) * progress)
+        if self.budget is not None:
+            # seconds of training per episode since the last evaluation
+            per_episode = (start_time - self.last_time) / max(1, episode - self.last_episode)
+            if per_episode > 0:
+                interval = max(interval, min(self.max_interval,
+                                             math.ceil((end_time - start_time) / (self.budget * per_episode))))
+
+        self.last_episode = episode
+        self.last_time = end_time
+        self.next_episode = episode + max(1, interval)
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("evaluation after episode {:d} | win rate: {:.5f} | next after episode {:d}"
+                          .format(episode, win_rate, self.next_episode))
+
+        return stop, win_rate, full
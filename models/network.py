@@ -0,0 +1,274 @@
+""" Neural networks for the network models.
+
+    Both backends build the same architecture (fully connected layers, relu activation on the hidden layers and
+    a linear output layer, trained with Adam on the mean squared error) and offer the subset of the Keras model
+    interface the models use: predict, fit, evaluate, output_shape, get_weights/set_weights and save/load.
+
+    NumpyNetwork is implemented in pure NumPy. For networks as small as the ones used here it is much faster
+    than Keras, especially when predicting a single state, and it does not need TensorFlow.
+    KerasNetwork wraps a Keras Sequential model; keras is only imported when it is used.
+"""
+import numpy as np
+
+
+class NumpyNetwork:
+    """ Multi layer perceptron implemented with NumPy.
+
+        :param list layers: Number of units per layer, starting with the input layer.
+        :param float learning_rate: Adam learning rate.
+    """
+
+    def __init__(self, layers, learning_rate=0.001, beta_1=0.9, beta_2=0.999, epsilon=1e-7):
+        self.layers = list(layers)
+        self.learning_rate = learning_rate
+        self.beta_1 = beta_1
+        self.beta_2 = beta_2
+        self.epsilon = epsilon
+
+        self.weights = []
+        for n_in, n_out in zip(self.layers[:-1], self.layers[1:]):
+            limit = np.sqrt(6 / (n_in + n_out))  # Glorot uniform, as Keras does for Dense layers
+            self.weights.append(np.random.uniform(-limit, limit, (n_in, n_out)).astype(np.float32))
+            self.weights.append(np.zeros(n_out, dtype=np.float32))
+
+        self.__reset_optimizer()
+
+    def __reset_optimizer(self):
+        self.iterations = 0
+        self.m = [np.zeros_like(w) for w in self.weights]  # first moment estimates
+        self.v = [np.zeros_like(w) for w in self.weights]  # second moment estimates
+
+    @property
+    def output_shape(self):
+        return None, self.layers[-1]
+
+    def __forward(self, x):
+        """ Propagate x through the network and return the output of every layer (input included). """
+        activations = [np.asarray(x, dtype=np.float32)]
+        n = len(self.weights) // 2
+        for i in range(n):
+            z = activations[-1] @ self.weights[2 * i] + self.weights[2 * i + 1]
+            activations.append(np.maximum(z, 0) if i < n - 1 else z)  # relu, linear for the output layer
+        return activations
+
+    def predict(self, x, verbose=0):
+        """ Predict the outputs for a batch of inputs.
+
+            :param np.array x: Inputs [batch][input_size].
+            :return np.array: Outputs [batch][output_size].
+        """
+        return self.__forward(x)[-1]
+
+    def evaluate(self, x, y, verbose=0, sample_weight=None):
+        """ Return the mean squared error of the predictions for x. """
+        loss = np.mean(np.square(self.predict(x) - y), axis=1)
+        if sample_weight is not None:
+            loss = loss * sample_weight
+        return float(np.mean(loss))
+
+    def fit(self, x, y, epochs=1, batch_size=32, verbose=0, sample_weight=None):
+        """ Train the network on inputs x and targets y using minibatches in random order.
+
+            :param np.array x: Inputs [batch][input_size].
+            :param np.array y: Targets [batch][output_size].
+            :param int epochs: Number of passes over the data.
+            :param int batch_size: Number of samples per gradient update.
+            :param np.array sample_weight: Weight of each sample in the loss (optional, else all 1).
+        """
+        x = np.asarray(x, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float32)
+        w = np.ones(len(x), dtype=np.float32) if sample_weight is None else np.asarray(sample_weight, np.float32)
+
+        for _ in range(epochs):
+            order = np.random.permutation(len(x))
+            for start in range(0, len(x), batch_size):
+                batch = order[start:start + batch_size]
+                self.__train_batch(x[batch], y[batch], w[batch])
+
+    def __train_batch(self, x, y, w):
+        """ Do one Adam update using the gradient of the (weighted) mean squared error over this batch. """
+        activations = self.__forward(x)
+
+        # derivative of mean(w * mean((y_pred - y)^2, axis=1)) to y_pred
+        delta = 2 * (activations[-1] - y) * w[:, None] / (y.shape[0] * y.shape[1])
+
+        gradients = [None] * len(self.weights)
+        for i in reversed(range(len(self.weights) // 2)):
+            gradients[2 * i] = activations[i].T @ delta
+            gradients[2 * i + 1] = delta.sum(axis=0)
+            if i > 0:
+                delta = (delta @ self.weights[2 * i].T) * (activations[i] > 0)  # backpropagate through relu
+
+        self.iterations += 1
+        lr = self.learning_rate * np.sqrt(1 - self.beta_2 ** self.iterations) / (1 - self.beta_1 ** self.iterations)
+        for weight, gradient, m, v in zip(self.weights, gradients, self.m, self.v):
+            m *= self.beta_1
+            m += (1 - self.beta_1) * gradient
+            v *= self.beta_2
+            v += (1 - self.beta_2) * np.square(gradient)
+            weight -= lr * m / (np.sqrt(v) + self.epsilon)
+
+    def get_weights(self):
+        return [w.copy() for w in self.weights]
+
+    def set_weights(self, weights):
+        self.weights = [np.array(w, dtype=np.float32) for w in weights]
+
+    def save(self, filename):
+        """ Save layer sizes and weights to filename.npz. """
+        np.savez(filename + ".npz", *self.weights, layers=np.array(self.layers))
+
+    @classmethod
+    def load(cls, filename):
+        """ Create a network from a file written by save(). """
+        with np.load(filename + ".npz") as data:
+            network = cls(data["layers"].tolist())
+            network.set_weights([data["arr_{}".format(i)] for i in range(len(network.weights))])
+        network.__reset_optimizer()
+        return network
+
+
+class KerasNetwork:
+    """ Keras Sequential model with the same architecture and interface as NumpyNetwork.
+
+        :param list layers: Number of units per layer, starting with the input layer.
+    """
+
+    def __init__(self, layers, model=None):
+        from keras import Sequential
+        from keras.layers import Dense
+
+        self.layers = list(layers)
+
+        if model is None:
+            model = Sequential()
+            model.add(Dense(layers[1], input_shape=(layers[0],), activation="relu"))
+            for units in layers[2:-1]:
+                model.add(Dense(units, activation="relu"))
+            model.add(Dense(layers[-1], activation="linear"))
+
+        self.model = model
+        self.model.compile(optimizer="adam", loss="mse")
+
+    @property
+    def output_shape(self):
+        return self.model.output_shape
+
+    def predict(self, x, verbose=0):
+        return self.model.predict(x, verbose=verbose)
+
+    def evaluate(self, x, y, verbose=0, sample_weight=None):
+        return self.model.evaluate(x, y, verbose=verbose, sample_weight=sample_weight)
+
+    def fit(self, x, y, epochs=1, batch_size=32, verbose=0, sample_weight=None):
+        self.model.fit(x, y, epochs=epochs, batch_size=batch_size, verbose=verbose, sample_weight=sample_weight)
+
+    def get_weights(self):
+        return self.model.get_weights()
+
+    def set_weights(self, weights):
+        self.model.set_weights(weights)
+
+    def save(self, filename):
+        """ Save architecture to filename.json and weights to filename.h5. """
+        with open(filename + ".json", "w") as outfile:
+            outfile.write(self.model.to_json())
+        self.model.save_weights(filename + ".h5", overwrite=True)
+
+    @classmethod
+    def load(cls, filename):
+        """ Create a network from the files written by save(). """
+        from keras.models import model_from_json
+
+        with open(filename + ".json", "r") as infile:
+            model = model_from_json(infile.read())
+        model.load_weights(filename + ".h5")
+
+        layers = [model.input_shape[-1]] + [layer.units for layer in model.layers]
+        return cls(layers, model=model)
+
+    def __getstate__(self):
+        """ Replace the Keras model by its architecture and weights, so a snapshot can be sent to another process. """
+        return self.layers, self.model.to_json(), self.model.get_weights()
+
+    def __setstate__(self, state):
+        from keras.models import model_from_json
+
+        layers, architecture, weights = state
+        self.__init__(layers, model=model_from_json(architecture))
+        self.model.set_weights(weights)
+
+
+backends = {
+    "numpy": NumpyNetwork,
+    "keras": KerasNetwork
+}
+
+
+class TargetNetwork:
+    """ Copy of a network which follows it slowly, used to calculate the bootstrap targets when training it.
+
+        The copy is either replaced by the network every 'update' training steps, or moved a fraction 'tau' towards
+        the network after every training step (Polyak averaging). Call step() after every fit() of the network.
+
+        :param network: The network which is trained (NumpyNetwork or KerasNetwork).
+        :param int update: Number of training steps between copies (ignored if tau is given).
+        :param float tau: Fraction the copy moves towards the network per training step (optional).
+    """
+
+    def __init__(self, network, update=100, tau=None):
+        self.network = network
+        self.update = update
+        self.tau = tau
+        self.steps = 0
+        self.target = type(network)(network.layers)
+        self.target.set_weights(network.get_weights())
+
+    def step(self):
+        """ Let the copy follow the network after a training step. """
+        self.steps += 1
+        if self.tau is not None:
+            self.target.set_weights([self.tau * w + (1 - self.tau) * t
+                                     for w, t in zip(self.network.get_weights(), self.target.get_weights())])
+        elif self.steps % self.update == 0:
+            self.target.set_weights(self.network.get_weights())
+
+    def values(self, next_states, double=False):
+        """ Estimate the value of next states using the copy.
+
+            :param np.array next_states: States [batch][state_size].
+            :param bool double: Double DQN: the network chooses the best action, the copy estimates its Q (else the
+                                copy does both, which tends to overestimate the Q's).
+            :return np.array: Value per state.
+        """
+        q = self.target.predict(next_states)
+        if double:
+            return q[np.arange(len(q)), np.argmax(self.network.predict(next_states), axis=1)]
+        return np.amax(q, axis=1)
+
+
+def target_network(network, **kwargs):
+    """ Create the TargetNetwork requested by the hyperparameters of a train() call, or None if none is wanted.
+
+        :keyword int target_update: number of training steps between copies of the network (0 = no target network)
+        :keyword float tau: move the target network this fraction towards the network after every training step
+        :keyword bool double: use Double DQN targets (needs a target network, target_update defaults to 100 then)
+    """
+    target_update = kwargs.get("target_update", 0)
+    tau = kwargs.get("tau", None)
+    if kwargs.get("double", False) and not target_update and tau is None:
+        target_update = 100
+    if not target_update and tau is None:
+        return None
+    return TargetNetwork(network, update=target_update, tau=tau)
+
+
+def create_network(layers, backend="numpy"):
+    """ Create a network using the selected backend.
+
+        :param list layers: Number of units per layer, starting with the input layer.
+        :param str backend: "numpy" or "keras".
+    """
+    if backend not in backends:
+        raise Exception("Error: unknown network backend {}".format(backend))
+    return backends[backend](layers)
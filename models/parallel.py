@@ -0,0 +1,173 @@
+""" Parallel tabular Q-learning for QTableModel.
+
+    Several worker processes each play training games in their own copy of the maze, with their own schedule of
+    starting cells, and all update one Q-table in shared memory. Updates are not locked (Hogwild): a worker can
+    occasionally overwrite an update of another worker to the same Q, but as every update only moves a Q a little
+    towards its target this hardly matters, while locking would serialize the workers again.
+
+    Workers draw episode numbers from a shared counter and write the outcome of every episode in a shared array.
+    The process which called train() turns these outcomes into metrics in episode order, and evaluates the model on
+    a snapshot of the shared table while the workers keep training. When training has finished the table is copied
+    into the model, and the shared memory is released.
+"""
+import multiprocessing
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from environment.trajectory_log import STATUS
+from models.table import QTable
+from profiling import NullProfiler
+
+NOT_FINISHED = -1  # outcome of an episode which has not finished yet
+
+
+def _worker(game, shm_name, shape, counter, outcomes, steps, worker, stop, discount, exploration_rate,
+            exploration_decay, learning_rate):
+    """ Play training games and update the shared Q-table until 'stop' is set or all episodes have been played.
+        Runs in a worker process.
+
+        :param class Maze game: Copy of the maze to play in.
+        :param str shm_name: Name of the shared memory block with the Q's.
+        :param tuple shape: Shape of the Q-table.
+        :param counter: Shared counter with the number of the last episode handed out.
+        :param outcomes: Shared array with the final status per episode (NOT_FINISHED if not finished).
+        :param steps: Shared array with the number of steps played per worker.
+        :param int worker: Index of this worker in 'steps'.
+        :param stop: Event which is set when training has finished.
+    """
+    random.seed()  # worker processes inherit the random state of the parent, so reseed
+    np.random.seed()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    Q = QTable(0, shape[1], decode=game.state_index)
+    Q.values = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    values = Q.values
+    start_list = list()  # starting cells not yet used by this worker
+
+    try:
+        while not stop.is_set():
+            with counter.get_lock():
+                episode = counter.value + 1
+                if episode >= len(outcomes):
+                    break
+                counter.value = episode
+
+            if not start_list:
+                start_list = game.empty.copy()
+            start_cell = start_list.pop(random.randrange(len(start_list)))
+
+            state = Q.index(game.reset(start_cell))
+            n = 0
+
+            while True:
+                if np.random.random() < exploration_rate:
+                    action = random.choice(game.actions)
+                else:
+                    q = values[state].copy()  # other workers can change the Q's while choosing
+                    action = random.choice(np.nonzero(q == np.amax(q))[0])
+
+                next_state, reward, status = game.step(action)
+                next_state = Q.index(next_state)
+                n += 1
+
+                values[state, action] += learning_rate * (reward + discount * values[next_state].max() -
+                                                          values[state, action])
+
+                if status in ("win", "lose"):
+                    break
+
+                state = next_state
+
+            steps[worker] += n
+            outcomes[episode] = STATUS[status]
+            exploration_rate *= exploration_decay
+    finally:
+        del Q, values  # release the buffer before closing the shared memory
+        shm.close()
+
+
+def train_parallel(model, workers, episodes, discount, exploration_rate, exploration_decay, learning_rate,
+                   profiler, hist, evaluator):
+    """ Train model.Q with worker processes. See the module docstring.
+
+        :param class QTableModel model: The model to train, training continues from its current Q's.
+        :param int workers: Number of worker processes.
+        :param int episodes: Number of training games to play, over all workers.
+        :param float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+        :param float exploration_rate: (epsilon) 0 = preference for exploring (0 = not at all, 1 = only)
+        :param float exploration_decay: exploration rate reduction after each game per worker (<= 1, 1 = no at all)
+        :param float learning_rate: (alpha) preference for using new knowledge (0 = not at all, 1 = only)
+        :param Profiler profiler: Times the phases of training.
+        :param Metrics hist: Collects the history of training.
+        :param Evaluator evaluator: Decides when to check the win rate and when to stop.
+        :return int, int: Number of episodes recorded, total number of steps played by the workers.
+    """
+    shape = model.Q.values.shape
+
+    context = multiprocessing.get_context()
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+    values = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    values[:] = model.Q.values
+    counter = context.Value("i", 0)  # episodes are numbered from 1, like in QTableModel.train()
+    outcomes = context.Array("b", [NOT_FINISHED] * episodes, lock=False)
+    steps = context.Array("q", workers, lock=False)
+    stop = context.Event()
+
+    game = model.environment
+    previous = game.display, game.recorder, game.writer, game.profiler
+    game.display = False  # workers neither render, record nor log their moves
+    game.recorder = None
+    game.writer = None
+    game.profiler = NullProfiler()
+
+    processes = [context.Process(target=_worker, args=(game, shm.name, shape, counter, outcomes, steps, worker, stop,
+                                                       discount, exploration_rate, exploration_decay,
+                                                       learning_rate), daemon=True)
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+
+    game.display, game.recorder, game.writer, game.profiler = previous
+
+    episode = 0
+    wins = 0
+
+    try:
+        while episode < episodes - 1:
+            with profiler.phase("wait"):
+                while episode < episodes - 1 and outcomes[episode + 1] == NOT_FINISHED:
+                    if not any(process.is_alive() for process in processes):
+                        raise Exception("Error: all workers have stopped")
+                    time.sleep(0.001)
+
+            stop_training = False
+            while episode < episodes - 1 and outcomes[episode + 1] != NOT_FINISHED:  # record in episode order
+                episode += 1
+                status = "win" if outcomes[episode] == STATUS["win"] else "lose"
+                if status == "win":
+                    wins += 1
+                hist.record(episode, status, wins, exploration_rate)
+
+                if evaluator.due(episode):
+                    with profiler.phase("win_all"):
+                        model.Q.values[:] = values  # snapshot, the workers keep changing the shared Q's
+                        stop_training, win_rate, full = evaluator.evaluate(model, episode)
+                    hist.record_win_rate(win_rate, full)
+                    if stop_training:
+                        break
+
+            if stop_training:
+                break
+    finally:
+        stop.set()
+        for process in processes:
+            process.join()
+        model.Q.values[:] = values
+        del values
+        shm.close()
+        shm.unlink()
+
+    return episode, sum(steps)
@@ -3,11 +3,12 @@ import random
 from datetime import datetime
 
 import numpy as np
-from keras import Sequential
-from keras.layers import Dense
 
 from environment.maze import actions
+from metrics import Metrics
 from models import AbstractModel
+from models.evaluator import Evaluator
+from models.network import create_network, target_network
 
 
 class QNetworkModel(AbstractModel):
@@ -15,21 +16,20 @@ class QNetworkModel(AbstractModel):
 
         The network learns how states connect to actions by playing training games. After every move the Q's
         are updated according to the Bellman equation. The resulting state + Q's are fed into the network.
-        State is represented as a [1][N] vector where N is the number of cells in the maze. The training
+        By default the state is a [1][N] vector where N is the number of cells in the maze (see Maze for other
+        observation modes), the size of the input layer follows the size of the state. The training
         algorithm ensures that the game is started from every possible cell. Training ends after a fixed
         number of games, or earlier if a stopping criterion is reached (here: a 100% win rate).
 
         :param class Maze game: Maze game object.
+        :keyword str backend: network implementation, "numpy" (default) or "keras" (see models.network)
     """
 
     def __init__(self, game, **kwargs):
         super().__init__(game, **kwargs)
 
-        self.model = Sequential()
-        self.model.add(Dense(game.maze.size, input_shape=(game.maze.size,), activation="relu"))
-        self.model.add(Dense(game.maze.size, activation="relu"))
-        self.model.add(Dense(len(actions), activation="linear"))
-        self.model.compile(optimizer="adam", loss="mse")
+        self.model = create_network([game.observation_size, game.maze.size, game.maze.size, len(actions)],
+                                    backend=kwargs.get("backend", "numpy"))
 
     def train(self, **kwargs):
         """ Hyperparameters:
@@ -37,15 +37,30 @@ class QNetworkModel(AbstractModel):
             :keyword float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
             :keyword float exploration_rate: (epsilon) 0 = preference for exploring (0 = not at all, 1 = only)
             :keyword int episodes: number of training games to play
-            :return int, datetime: number of training episodes, total time spent
+            :keyword int target_update: number of training steps between copies of the target network (0 = none)
+            :keyword float tau: move the target network this fraction towards the network after every training step
+            :keyword bool double: use Double DQN targets (implies a target network, see models.network.target_network)
+            :keyword Profiler profiler: times the phases of training (default Maze.profiler), see profiling
+            :keyword Metrics metrics: collects the history of training (optional, else a Metrics with a LogSink)
+            :keyword Evaluator evaluator: decides when to check the win rate and when to stop (optional, else default)
+            :return Metrics, int, datetime: training history, number of training episodes, total time spent
         """
 
         discount = kwargs.get("discount", 0.90)
         exploration_rate = kwargs.get("exploration_rate", 0.10)
         episodes = kwargs.get("episodes", 1000)
+        double = kwargs.get("double", False)
+        target_model = target_network(self.model, **kwargs)  # None = calculate targets with the network itself
+        profiler = kwargs.get("profiler", self.environment.profiler)
+        hist = kwargs.get("metrics")  # store evolution of status, wins, win rate etc. for reporting purposes
+        if hist is None:
+            hist = Metrics()
+        evaluator = kwargs.get("evaluator")
+        if evaluator is None:
+            evaluator = Evaluator()
+        evaluator.reset()
 
         wins = 0
-        hist = []
         start_list = list()  # starting cells not yet used for training
         start_time = datetime.now()
 
@@ -60,26 +75,37 @@ class QNetworkModel(AbstractModel):
             loss = 0.0
 
             while True:
-                q = self.model.predict(state)
+                with profiler.phase("predict"):
+                    q = self.model.predict(state)
 
-                if np.random.random() < exploration_rate:
-                    action = random.choice(self.environment.actions)
-                else:
-                    mv = np.amax(q[0])
-                    actions = np.nonzero(q[0] == mv)[0]
-                    action = random.choice(actions)
+                    if np.random.random() < exploration_rate:
+                        action = random.choice(self.environment.actions)
+                    else:
+                        mv = np.amax(q[0])
+                        actions = np.nonzero(q[0] == mv)[0]
+                        action = random.choice(actions)
 
-                next_state, reward, status = self.environment.step(action)
+                with profiler.phase("step"):
+                    next_state, reward, status = self.environment.step(action)
 
                 if status in ("win", "lose"):
                     target = reward  # no discount needed if a terminal state was reached.
                 else:
-                    target = reward + discount * np.amax(self.model.predict(next_state)[0])
+                    with profiler.phase("predict"):
+                        if target_model is None:
+                            target = reward + discount * np.amax(self.model.predict(next_state)[0])
+                        else:
+                            target = reward + discount * target_model.values(next_state, double)[0]
 
                 q[0][action] = target  # update Q value for this action
 
-                self.model.fit(state, q, epochs=1, verbose=0)
-                loss += self.model.evaluate(state, q, verbose=0)
+                with profiler.phase("fit"):
+                    self.model.fit(state, q, epochs=1, verbose=0)
+                    if target_model is not None:
+                        target_model.step()
+
+                with profiler.phase("loss"):
+                    loss += self.model.evaluate(state, q, verbose=0)
 
                 if status in ("win", "lose"):  # terminal state reached, stop episode
                     if status == "win":
@@ -88,22 +114,41 @@ class QNetworkModel(AbstractModel):
 
                 state = next_state
 
-            logging.info("episode: {:d}/{:d} | status: {:4s} | loss: {:.4f} | total wins: {:d} | e: {:.5f}"
-                         .format(episode, episodes, status, loss, wins, exploration_rate))
+            hist.record(episode, status, wins, exploration_rate, loss)
 
-            if episode % 5 == 0:
+            if evaluator.due(episode):
                 # check if the current model wins from all starting cells
                 # can only do this if there is a finite number of starting states
-                w_all, win_rate = self.environment.win_all(self)
-                hist.append(win_rate)
-                if w_all is True:
+                with profiler.phase("win_all"):
+                    stop, win_rate, full = evaluator.evaluate(self, episode)
+                hist.record_win_rate(win_rate, full)
+                if stop is True:
                     logging.info("won from all start cells, stop learning")
                     break
 
+        hist.flush()
+
         logging.info("episodes: {:d} | time spent: {}".format(episode, datetime.now() - start_time))
+        profiler.report()
 
         return hist, episode, datetime.now() - start_time
 
+    def q(self, state):
+        """ Get the Q's for all actions in state from the network.
+
+            :param np.array state: Game state.
+            :return np.array: Q per action.
+        """
+        return self.model.predict(state)[0]
+
+    def q_batch(self, states):
+        """ Get the Q's for all actions in a batch of states from the network, in one forward pass.
+
+            :param np.array states: Game states [n][observation_size].
+            :return np.array: Q per state and action [n][num_actions].
+        """
+        return self.model.predict(states)
+
     def predict(self, state):
         """ Policy: choose the action with the highest Q from the Q-table. Random choice if there are multiple actions
             with an equal max Q.
@@ -111,8 +156,8 @@ class QNetworkModel(AbstractModel):
             :param np.array state: Game state.
             :return int: Chosen action.
         """
-        q = self.model.predict(state)
+        q = self.q(state)
 
-        mv = np.amax(q[0])  # determine max Q
-        actions = np.nonzero(q[0] == mv)[0]  # extract (index of) action(s) with the max Q
+        mv = np.amax(q)  # determine max Q
+        actions = np.nonzero(q == mv)[0]  # extract (index of) action(s) with the max Q
         return random.choice(actions)
@@ -3,37 +3,71 @@ import random
 from datetime import datetime
 
 import numpy as np
-from keras import Sequential
-from keras.layers import Dense
-from keras.models import model_from_json
 
 from environment.maze import actions
+from metrics import Metrics
 from models import AbstractModel
+from models.distributed import train_actor_learner
+from models.evaluator import Evaluator
+from models.network import backends, create_network, target_network
 
 
 class ExperienceReplay:
     """ Store game transitions (from state s to s' via action a) and record the rewards. When
         a sample is requested update the Q's.
 
-        :param model: Keras NN model.
+        The transitions are stored in preallocated arrays which are used as a ring buffer: when the memory is
+        full the oldest transition is overwritten. States are stored using a compact dtype; int8 is sufficient
+        for the cell values of a maze, but not for cell indices or coordinates in a large maze (see state_dtype()).
+
+        :param model: Neural network (see models.network).
         :param int max_memory: Number of consecutive game transitions to store.
         :param float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+        :param dtype: Data type used to store states.
+        :param TargetNetwork target: Network which estimates the value of next states (optional, else the model).
+        :param bool double: Use Double DQN targets (only with a target network).
     """
 
-    def __init__(self, model, max_memory=1000, discount=0.95):
+    def __init__(self, model, max_memory=1000, discount=0.95, dtype=np.int8, target=None, double=False):
         self.model = model
+        self.target = target
+        self.double = double
         self.discount = discount
-        self.memory = list()
         self.max_memory = max_memory
+        self.dtype = dtype
+        self.size = 0  # number of transitions currently stored
+        self.position = 0  # index where the next transition will be stored
+
+        # arrays are allocated when the first transition arrives, as only then the size of a state is known
+        self.states = None
+        self.actions = np.zeros(max_memory, dtype=np.int8)
+        self.rewards = np.zeros(max_memory, dtype=np.float32)
+        self.next_states = None
+        self.terminal = np.zeros(max_memory, dtype=bool)
+
+    def __len__(self):
+        return self.size
 
     def remember(self, transition):
-        """ Add a game transition at the tail of the memory list.
+        """ Store a game transition, overwriting the oldest one if the memory is full.
 
             :param list transition: [state, move, reward, next_state, status]
         """
-        self.memory.append(transition)
-        if len(self.memory) > self.max_memory:
-            del self.memory[0]  # forget the oldest memories
+        state, move, reward, next_state, status = transition
+
+        if self.states is None:
+            self.states = np.zeros((self.max_memory, state.size), dtype=self.dtype)
+            self.next_states = np.zeros((self.max_memory, state.size), dtype=self.dtype)
+
+        i = self.position
+        self.states[i] = state.ravel()
+        self.actions[i] = move
+        self.rewards[i] = reward
+        self.next_states[i] = next_state.ravel()
+        self.terminal[i] = status == "win"  # no discount needed if a terminal state was reached
+
+        self.position = (i + 1) % self.max_memory
+        self.size = min(self.size + 1, self.max_memory)
 
     def predict(self, state):
         """ Predict the Q vector belonging to this state.
@@ -47,29 +81,161 @@ class ExperienceReplay:
         """ Retrieve a number of random observed game states and the corresponding Q target vectors.
 
         :param int sample_size: Number of states to return
-        :return np.array: input and target vectors
+        :return np.array, np.array, np.array: input vectors, target vectors and sample weights (None = all equal)
         """
-        mem_size = len(self.memory)  # how many episodes are currently stored
-        sample_size = min(mem_size, sample_size)  # cannot take more samples then available in memory
-        state_size = self.memory[0][0].size  # number of cells in maze
-        num_actions = self.model.output_shape[-1]  # number of actions based in output layer
+        sample_size = min(self.size, sample_size)  # cannot take more samples then available in memory
+
+        idx = np.random.choice(self.size, sample_size, replace=False)
+        states, targets, _ = self.targets(idx)
 
-        states = np.zeros((sample_size, state_size), dtype=int)
-        targets = np.zeros((sample_size, num_actions), dtype=float)
+        return states, targets, None
+
+    def targets(self, idx):
+        """ Calculate the Q target vectors for the transitions at positions idx.
+
+        :param np.array idx: Positions in the memory.
+        :return np.array, np.array, np.array: input vectors, target vectors and TD errors of the chosen actions
+        """
+        states = self.states[idx]
+        rows = np.arange(len(idx))
+
+        if self.target is None:
+            # predict the Q's of all sampled states and next states in one pass through the network
+            q = self.model.predict(np.concatenate((states, self.next_states[idx])))
+            targets = np.array(q[:len(idx)], dtype=float)
+            max_next_q = np.amax(q[len(idx):], axis=1)
+        else:
+            targets = np.array(self.model.predict(states), dtype=float)
+            max_next_q = self.target.values(self.next_states[idx], self.double)
 
         # update the Q's from the sample using the Bellman equation
-        for i, idx in enumerate(np.random.choice(range(mem_size), sample_size, replace=False)):
-            state, move, reward, next_state, status = self.memory[idx]
+        # no discount needed if a terminal state was reached
+        target = self.rewards[idx] + np.where(self.terminal[idx], 0.0, self.discount * max_next_q)
+        errors = target - targets[rows, self.actions[idx]]
+        targets[rows, self.actions[idx]] = target
+
+        return states, targets, errors
+
+
+def state_dtype(game):
+    """ Smallest data type which can store the states of a maze without overflow.
 
-            states[i] = state
-            targets[i] = self.predict(state)
+        :param class Maze game: Maze game object.
+        :return numpy.dtype: int8 for states with cell values, else large enough for the highest cell index.
+    """
+    if game.observation in ("cell", "coordinates"):
+        return np.min_scalar_type(game.maze.size - 1)
+    return np.dtype(np.int8)
+
+
+class SumTree:
+    """ Binary tree in an array where every node holds the sum of the priorities of the leaves below it.
+
+        Node 1 is the root, the children of node i are nodes 2i and 2i+1, and the leaves (one per position in the
+        memory) are nodes capacity ... 2 * capacity - 1. Updating priorities and finding the positions which belong
+        to cumulative priorities both take O(log n) per item, and are done for a whole batch at once.
+
+        :param int size: Number of leaves (rounded up to a power of 2 internally).
+    """
 
-            if status == "win":
-                targets[i, move] = reward  # no discount needed if a terminal state was reached.
-            else:
-                targets[i, move] = reward + self.discount * np.amax(self.predict(next_state))
+    def __init__(self, size):
+        self.capacity = 1 << max(0, int(size - 1).bit_length())
+        self.nodes = np.zeros(2 * self.capacity, dtype=np.float64)
+
+    @property
+    def total(self):
+        """ Sum of all priorities. """
+        return self.nodes[1]
+
+    def priorities(self, idx):
+        return self.nodes[idx + self.capacity]
+
+    def update(self, idx, priorities):
+        """ Set the priorities of the leaves at positions idx and recalculate the sums above them. """
+        nodes = np.asarray(idx) + self.capacity
+        self.nodes[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] > 0:
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """ For every value in [0, total) return the position of the leaf where the cumulative priority reaches it. """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.capacity:  # all leaves are at the same depth
+            left = 2 * nodes
+            right = values >= self.nodes[left]
+            values -= np.where(right, self.nodes[left], 0.0)
+            nodes = left + right
+        return nodes - self.capacity
+
+
+class PrioritizedExperienceReplay(ExperienceReplay):
+    """ Experience replay which samples transitions with a large TD error more often.
+
+        The priority of a transition is (|TD error| + epsilon) ^ alpha; new transitions get the highest priority
+        seen so far, so each is replayed at least once. Priorities are kept in a SumTree and are updated with the
+        TD errors calculated when the transitions are sampled. As sampling is no longer uniform, every sample gets
+        an importance sampling weight (N * P(i)) ^ -beta, normalized to a maximum of 1, which should be passed to
+        fit(). Beta grows towards 1 during training.
+
+        :param model: Neural network (see models.network).
+        :param int max_memory: Number of consecutive game transitions to store.
+        :param float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+        :param dtype: Data type used to store states.
+        :param float alpha: How much prioritization is used (0 = uniform sampling).
+        :param float beta: Initial importance sampling correction (1 = full correction).
+        :param float beta_increment: Increase of beta per sample.
+        :param float epsilon: Added to the TD errors so no transition gets priority 0.
+        :param TargetNetwork target: Network which estimates the value of next states (optional, else the model).
+        :param bool double: Use Double DQN targets (only with a target network).
+    """
 
-        return states, targets
+    def __init__(self, model, max_memory=1000, discount=0.95, dtype=np.int8, alpha=0.6, beta=0.4,
+                 beta_increment=0.001, epsilon=0.01, target=None, double=False):
+        super().__init__(model, max_memory=max_memory, discount=discount, dtype=dtype, target=target,
+                         double=double)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.tree = SumTree(max_memory)
+        self.max_priority = 1.0
+
+    def remember(self, transition):
+        """ Store a game transition with the highest priority, overwriting the oldest one if the memory is full.
+
+            :param list transition: [state, move, reward, next_state, status]
+        """
+        i = self.position
+        super().remember(transition)
+        self.tree.update([i], [self.max_priority])
+
+    def get_samples(self, sample_size=10):
+        """ Retrieve a number of observed game states, chosen by priority, and the corresponding Q target vectors.
+
+        :param int sample_size: Number of states to return
+        :return np.array, np.array, np.array: input vectors, target vectors and importance sampling weights
+        """
+        sample_size = min(self.size, sample_size)  # cannot take more samples then available in memory
+
+        # one sample from every of sample_size equal parts of the total priority
+        total = self.tree.total
+        values = (np.arange(sample_size) + np.random.random(sample_size)) * (total / sample_size)
+        idx = np.minimum(self.tree.find(np.minimum(values, np.nextafter(total, 0))), self.size - 1)
+
+        weights = (self.size * self.tree.priorities(idx) / total) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        states, targets, errors = self.targets(idx)
+
+        priorities = (np.abs(errors) + self.epsilon) ** self.alpha
+        self.tree.update(idx, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+        return states, targets, weights
 
 
 class QReplayNetworkModel(AbstractModel):
@@ -80,30 +246,24 @@ class QReplayNetworkModel(AbstractModel):
         earlier if a stopping criterion is reached (here: a 100% win rate).
 
         :param class Maze game: Maze game object.
+        :keyword str backend: network implementation, "numpy" (default) or "keras" (see models.network)
     """
 
     def __init__(self, game, **kwargs):
         super().__init__(game, **kwargs)
+        self.backend = kwargs.get("backend", "numpy")
 
         if kwargs.get("load", False) is False:
-            self.model = Sequential()
-            self.model.add(Dense(game.maze.size, input_shape=(game.maze.size,), activation="relu"))
-            self.model.add(Dense(game.maze.size, activation="relu"))
-            self.model.add(Dense(len(actions), activation="linear"))
+            self.model = create_network([game.observation_size, game.maze.size, game.maze.size, len(actions)],
+                                        backend=self.backend)
         else:
             self.load(self.name)
 
-        self.model.compile(optimizer="adam", loss="mse")
-
     def save(self, filename):
-        with open(filename + ".json", "w") as outfile:
-            outfile.write(self.model.to_json())
-        self.model.save_weights(filename + ".h5", overwrite=True)
+        self.model.save(filename)
 
     def load(self, filename):
-        with open(filename + ".json", "r") as infile:
-            self.model = model_from_json(infile.read())
-        self.model.load_weights(filename + ".h5")
+        self.model = backends[self.backend].load(filename)
 
     def train(self, **kwargs):
         """ Hyperparameters:
@@ -112,20 +272,74 @@ class QReplayNetworkModel(AbstractModel):
             :keyword float exploration_rate: (epsilon) 0 = preference for exploring (0 = not at all, 1 = only)
             :keyword int episodes: number of training games to play
             :keyword int sample_size: number of samples to replay for training
-            :return int, datetime: number of training episodes, total time spent
+            :keyword int max_memory: number of game transitions to keep for replay
+            :keyword dtype: data type used to store states for replay (optional, else see state_dtype())
+            :keyword bool prioritized: replay transitions with a large TD error more often (see
+                                       PrioritizedExperienceReplay)
+            :keyword float alpha: how much prioritization is used (0 = uniform sampling)
+            :keyword float beta: initial importance sampling correction (1 = full correction)
+            :keyword int target_update: number of training steps between copies of the target network (0 = none)
+            :keyword float tau: move the target network this fraction towards the network after every training step
+            :keyword bool double: use Double DQN targets (implies a target network, see models.network.target_network)
+            :keyword int actors: number of processes playing games while this process learns (0 = play and learn in
+                                 turns in this process), see models.distributed
+            :keyword int sync_interval: number of fits between sending the weights to the actors
+            :keyword float replay_ratio: number of fits per transition the actors send
+            :keyword Profiler profiler: times the phases of training (default Maze.profiler), see profiling
+            :keyword Metrics metrics: collects the history of training (optional, else a Metrics with a LogSink)
+            :keyword Evaluator evaluator: decides when to check the win rate and when to stop (optional, else default)
+            :return Metrics, int, datetime: training history, number of training episodes, total time spent
         """
         discount = kwargs.get("discount", 0.90)
         exploration_rate = kwargs.get("exploration_rate", 0.10)
         episodes = kwargs.get("episodes", 10000)
         sample_size = kwargs.get("sample_size", 32)
-
-        experience = ExperienceReplay(self.model, discount=discount)
+        max_memory = kwargs.get("max_memory", 1000)
+        dtype = kwargs.get("dtype")
+        if dtype is None:
+            dtype = state_dtype(self.environment)
+        prioritized = kwargs.get("prioritized", False)
+        alpha = kwargs.get("alpha", 0.6)
+        beta = kwargs.get("beta", 0.4)
+        double = kwargs.get("double", False)
+        target_model = target_network(self.model, **kwargs)  # None = calculate targets with the network itself
+        actors = kwargs.get("actors", 0)
+        sync_interval = kwargs.get("sync_interval", 10)
+        replay_ratio = kwargs.get("replay_ratio", 1.0)
+        profiler = kwargs.get("profiler", self.environment.profiler)
+        hist = kwargs.get("metrics")  # store evolution of status, wins, win rate etc. for reporting purposes
+        if hist is None:
+            hist = Metrics()
+        evaluator = kwargs.get("evaluator")
+        if evaluator is None:
+            evaluator = Evaluator()
+        evaluator.reset()
+
+        if prioritized:
+            experience = PrioritizedExperienceReplay(self.model, max_memory=max_memory, discount=discount,
+                                                     dtype=dtype, alpha=alpha, beta=beta, target=target_model,
+                                                     double=double)
+        else:
+            experience = ExperienceReplay(self.model, max_memory=max_memory, discount=discount, dtype=dtype,
+                                          target=target_model, double=double)
 
         wins = 0
-        hist = []
         start_list = list()  # starting cells not yet used for training
         start_time = datetime.now()
 
+        if actors > 0:
+            episode = train_actor_learner(self, experience, actors, episodes, exploration_rate, sample_size,
+                                          sync_interval, replay_ratio, target_model, profiler, hist, evaluator)
+
+            hist.flush()
+            self.save(self.name)
+
+            logging.info("episodes: {:d} | actors: {:d} | time spent: {}"
+                         .format(episode, actors, datetime.now() - start_time))
+            profiler.report()
+
+            return hist, episode, datetime.now() - start_time
+
         for episode in range(1, episodes):
             if not start_list:
                 start_list = self.environment.empty.copy()
@@ -137,52 +351,81 @@ class QReplayNetworkModel(AbstractModel):
             loss = 0.0
 
             while True:
-                if np.random.random() < exploration_rate:
-                    action = random.choice(self.environment.actions)
-                else:
-                    q = experience.predict(state)
-                    mv = np.amax(q)
-                    actions = np.nonzero(q == mv)[0]
-                    action = random.choice(actions)
+                with profiler.phase("predict"):
+                    if np.random.random() < exploration_rate:
+                        action = random.choice(self.environment.actions)
+                    else:
+                        q = experience.predict(state)
+                        mv = np.amax(q)
+                        actions = np.nonzero(q == mv)[0]
+                        action = random.choice(actions)
 
-                next_state, reward, status = self.environment.step(action)
+                with profiler.phase("step"):
+                    next_state, reward, status = self.environment.step(action)
 
-                experience.remember([state, action, reward, next_state, status])
+                with profiler.phase("remember"):
+                    experience.remember([state, action, reward, next_state, status])
 
                 if status in ("win", "lose"):  # terminal state reached, stop episode
                     if status == "win":
                         wins += 1
                     break
 
-                inputs, targets = experience.get_samples(sample_size=sample_size)
+                with profiler.phase("sample"):
+                    inputs, targets, weights = experience.get_samples(sample_size=sample_size)
 
-                self.model.fit(inputs,
-                               targets,
-                               epochs=4,
-                               batch_size=16,
-                               verbose=0)
-                loss += self.model.evaluate(inputs, targets, verbose=0)
+                with profiler.phase("fit"):
+                    self.model.fit(inputs,
+                                   targets,
+                                   epochs=4,
+                                   batch_size=16,
+                                   verbose=0,
+                                   sample_weight=weights)
+                    if target_model is not None:
+                        target_model.step()
+
+                with profiler.phase("loss"):
+                    loss += self.model.evaluate(inputs, targets, verbose=0, sample_weight=weights)
 
                 state = next_state
 
-            logging.info("episode: {:d}/{:d} | status: {:4s} | loss: {:.4f} | total wins: {:d} | e: {:.5f}"
-                         .format(episode, episodes, status, loss, wins, exploration_rate))
+            hist.record(episode, status, wins, exploration_rate, loss)
 
-            if episode % 5 == 0:
+            if evaluator.due(episode):
                 # check if the current model wins from all starting cells
                 # can only do this if there is a finite number of starting states
-                w_all, win_rate = self.environment.win_all(self)
-                hist.append(win_rate)
-                if w_all is True:
+                with profiler.phase("win_all"):
+                    stop, win_rate, full = evaluator.evaluate(self, episode)
+                hist.record_win_rate(win_rate, full)
+                if stop is True:
                     logging.info("won from all start cells, stop learning")
                     break
 
         self.save(self.name)  # Save trained models weights and architecture
 
+        hist.flush()
+
         logging.info("episodes: {:d} | time spent: {}".format(episode, datetime.now() - start_time))
+        profiler.report()
 
         return hist, episode, datetime.now() - start_time
 
+    def q(self, state):
+        """ Get the Q's for all actions in state from the network.
+
+            :param np.array state: Game state.
+            :return np.array: Q per action.
+        """
+        return self.model.predict(state)[0]
+
+    def q_batch(self, states):
+        """ Get the Q's for all actions in a batch of states from the network, in one forward pass.
+
+            :param np.array states: Game states [n][observation_size].
+            :return np.array: Q per state and action [n][num_actions].
+        """
+        return self.model.predict(states)
+
     def predict(self, state):
         """ Policy: choose the action with the highest Q from the Q-table. Random choice if there are multiple actions
             with an equal max Q.
@@ -190,8 +433,8 @@ class QReplayNetworkModel(AbstractModel):
             :param np.array state: Game state.
             :return int: Chosen action.
         """
-        q = self.model.predict(state)
+        q = self.q(state)
 
-        mv = np.amax(q[0])  # determine max Q
-        actions = np.nonzero(q[0] == mv)[0]  # extract (index of) action(s) with the max Q
+        mv = np.amax(q)  # determine max Q
+        actions = np.nonzero(q == mv)[0]  # extract (index of) action(s) with the max Q
         return random.choice(actions)
@@ -4,24 +4,25 @@ from datetime import datetime
 
 import numpy as np
 
+from metrics import Metrics
 from models import AbstractModel
+from models.evaluator import Evaluator
+from models.parallel import train_parallel
+from models.table import QTableMixin
 
 
-class QTableModel(AbstractModel):
+class QTableModel(QTableMixin, AbstractModel):
     """ Prediction model which uses Q-learning and a Q-table.
 
         For every state (= maze layout with the agents current location ) the Q for each of the actions is stored.
-        in a table. The key for this table is (state + action). Initially all Q's are 0. When playing training games
-        after every move the Q's in the table are updated based on the reward gained after making the move. Training
-        ends after a fixed number of games, or earlier if a stopping criterion is reached (here: a 100% win rate).
+        in a table. The row in this table is the agents cell, the column the action. Initially all Q's are 0. When
+        playing training games after every move the Q's in the table are updated based on the reward gained after
+        making the move. Training ends after a fixed number of games, or earlier if a stopping criterion is reached
+        (here: a 100% win rate).
 
         :param class Maze game: Maze game object.
     """
 
-    def __init__(self, game, **kwargs):
-        super().__init__(game, **kwargs)
-        self.Q = dict()  # table with Q per (state, action) combination
-
     def train(self, **kwargs):
         """ Hyperparameters:
 
@@ -30,19 +31,49 @@ class QTableModel(AbstractModel):
             :keyword float exploration_decay: exploration rate reduction after each random step (<= 1, 1 = no at all)
             :keyword float learning_rate: (alpha) preference for using new knowledge (0 = not at all, 1 = only)
             :keyword int episodes: number of training games to play
-            :return int, datetime: number of training episodes, total time spent
+            :keyword int workers: number of processes playing games and updating one shared Q-table (0 = train in
+                                  this process), see models.parallel
+            :keyword Profiler profiler: times the phases of training (default Maze.profiler), see profiling
+            :keyword Metrics metrics: collects the history of training (optional, else a Metrics with a LogSink)
+            :keyword Evaluator evaluator: decides when to check the win rate and when to stop (optional, else default)
+            :return Metrics, int, datetime: training history, number of training episodes, total time spent
         """
         discount = kwargs.get("discount", 0.90)
         exploration_rate = kwargs.get("exploration_rate", 0.10)
         exploration_decay = kwargs.get("exploration_decay", 1.00)  # reduction per step = 100 - exploration decay
         learning_rate = kwargs.get("learning_rate", 0.10)
         episodes = kwargs.get("episodes", 1000)
+        workers = kwargs.get("workers", 0)
+        profiler = kwargs.get("profiler", self.environment.profiler)
+        hist = kwargs.get("metrics")  # store evolution of status, wins, win rate etc. for reporting purposes
+        if hist is None:
+            hist = Metrics()
+        evaluator = kwargs.get("evaluator")
+        if evaluator is None:
+            evaluator = Evaluator()
+        evaluator.reset()
+
+        self.hyperparameters = dict(discount=discount, exploration_rate=exploration_rate,
+                                    exploration_decay=exploration_decay, learning_rate=learning_rate)
 
         wins = 0
-        hist = []  # store evolution of win rate for reporting purposes
         start_list = list()
         start_time = datetime.now()
 
+        if workers > 0:
+            episode, steps = train_parallel(self, workers, episodes, discount, exploration_rate, exploration_decay,
+                                            learning_rate, profiler, hist, evaluator)
+
+            hist.flush()
+
+            seconds = (datetime.now() - start_time).total_seconds()
+            logging.info("episodes: {:d} | workers: {:d} | steps/sec: {:.0f} | time spent: {}"
+                         .format(episode, workers, steps / seconds if seconds > 0 else 0.0,
+                                 datetime.now() - start_time))
+            profiler.report()
+
+            return hist, episode, datetime.now() - start_time
+
         for episode in range(1, episodes):
             # optimization: make sure to start from all possible cells
             if not start_list:
@@ -51,24 +82,25 @@ class QTableModel(AbstractModel):
             start_list.remove(start_cell)
 
             state = self.environment.reset(start_cell)
-            state = tuple(state.flatten())  # change state np.ndarray to tuple so it can be used as dictionary key
+            state = self.Q.index(state)  # change state np.ndarray to the index of its row in the Q-table
 
             while True:
                 # explore less and less as training progresses
-                if np.random.random() < exploration_rate:
-                    action = random.choice(self.environment.actions)
-                else:
-                    action = self.predict(state)
-
-                next_state, reward, status = self.environment.step(action)
-                next_state = tuple(next_state.flatten())
+                with profiler.phase("predict"):
+                    if np.random.random() < exploration_rate:
+                        action = random.choice(self.environment.actions)
+                    else:
+                        action = self.predict(state)
 
-                if (state, action) not in self.Q.keys():  # ensure a Q exists for (state, action) to avoid a KeyError
-                    self.Q[(state, action)] = 0.0
+                with profiler.phase("step"):
+                    next_state, reward, status = self.environment.step(action)
+                    next_state = self.Q.index(next_state)
 
-                max_next_Q = max([self.Q.get((next_state, a), 0.0) for a in self.environment.actions])
+                with profiler.phase("update"):
+                    max_next_Q = self.Q.values[next_state].max()
 
-                self.Q[(state, action)] += learning_rate * (reward + discount * max_next_Q - self.Q[(state, action)])
+                    self.Q.values[state, action] += learning_rate * (reward + discount * max_next_Q -
+                                                                     self.Q.values[state, action])
 
                 if status in ("win", "lose"):  # terminal state reached, stop training episode
                     if status == "win":
@@ -77,37 +109,23 @@ class QTableModel(AbstractModel):
 
                 state = next_state
 
-            logging.info("episode: {:d}/{:d} | status: {:4s} | total wins: {:d} | e: {:.5f}"
-                         .format(episode, episodes, status, wins, exploration_rate))
+            hist.record(episode, status, wins, exploration_rate)
 
-            if episode % 5 == 0:
+            if evaluator.due(episode):
                 # check if the current model wins from all starting cells
                 # can only do this if there is a finite number of starting states
-                w_all, win_rate = self.environment.win_all(self)
-                hist.append(win_rate)
-                if w_all is True:
+                with profiler.phase("win_all"):
+                    stop, win_rate, full = evaluator.evaluate(self, episode)
+                hist.record_win_rate(win_rate, full)
+                if stop is True:
                     logging.info("won from all start cells, stop learning")
                     break
 
             exploration_rate *= exploration_decay
 
+        hist.flush()
+
         logging.info("episodes: {:d} | time spent: {}".format(episode, datetime.now() - start_time))
+        profiler.report()
 
         return hist, episode, datetime.now() - start_time
-
-    def predict(self, state):
-        """ Policy: choose the action with the highest Q from the Q-table. Random choice if multiple actions
-            have the same (max) Q.
-
-            :param np.array state: Game state.
-            :return int: Chosen action.
-        """
-        if type(state) == np.ndarray:
-            state = tuple(state.flatten())
-
-        q = [self.Q.get((state, a), 0.0) for a in self.environment.actions]
-        logging.debug("q[] = {}".format(q))
-
-        mv = np.amax(q)  # determine max Q
-        actions = np.nonzero(q == mv)[0]  # extract (index of) action(s) with the max Q
-        return random.choice(actions)
@@ -0,0 +1,115 @@
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from environment.trajectory_log import STATUS, TrajectoryReader
+from models.qtable import QTableModel
+
+
+class OfflineQTableModel(QTableModel):
+    """ Prediction model which learns a Q-table from recorded transitions instead of by playing (fitted Q-learning).
+
+        The transitions are typically logged by a TrajectoryWriter while other models were training. Identical
+        transitions are first merged, then every iteration applies the Q-learning update to all (state, action)
+        pairs at once: Q(s, a) = mean over the recorded transitions from (s, a) of r + gamma * max Q(s', a').
+        Iterations stop when the largest change drops below a tolerance. Pairs which never occur in the data keep
+        Q = 0. The result is the same kind of Q-table the QTableModel learns online, and can be used (or trained
+        further) by it.
+
+        :param class Maze game: Maze game object.
+    """
+
+    def train(self, **kwargs):
+        """ Hyperparameters:
+
+            :keyword transitions: directory written by a TrajectoryWriter, a TrajectoryReader or an array of records
+            :keyword float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+            :keyword float tolerance: stop when the largest change in an iteration is smaller than this
+            :keyword int max_iterations: maximum number of passes over all transitions
+            :keyword int batch_size: number of records read at once when merging the transitions
+            :keyword Profiler profiler: times the phases of training (default Maze.profiler), see profiling
+            :return list, int, datetime: largest change per iteration, number of iterations, total time spent
+        """
+        transitions = kwargs.get("transitions")
+        discount = kwargs.get("discount", 0.90)
+        tolerance = kwargs.get("tolerance", 1e-6)
+        max_iterations = kwargs.get("max_iterations", 10000)
+        batch_size = kwargs.get("batch_size", 1 << 20)
+        profiler = kwargs.get("profiler", self.environment.profiler)
+
+        if transitions is None:
+            raise Exception("Error: no transitions to train on")
+
+        self.hyperparameters = dict(discount=discount, tolerance=tolerance)
+
+        hist = []  # store evolution of the largest change for reporting purposes
+        start_time = datetime.now()
+
+        with profiler.phase("merge"):
+            pair, next_cell, terminal, reward_sum, count = self.__merge(transitions, batch_size)
+
+        n_pairs = self.Q.values.size
+        pair_count = np.bincount(pair, weights=count, minlength=n_pairs)
+        seen = pair_count > 0
+        if not np.any(seen):
+            raise Exception("Error: no transitions to train on")
+
+        q = self.Q.values.reshape(-1)  # a view, so updates end up in the Q-table
+        discount_count = np.where(terminal, 0.0, discount * count)  # the exit has no future
+
+        for iteration in range(1, max_iterations + 1):
+            with profiler.phase("iteration"):
+                v = self.Q.values.max(axis=1)
+                target = np.bincount(pair, weights=reward_sum + discount_count * v[next_cell], minlength=n_pairs)
+                new_q = target[seen] / pair_count[seen]
+
+            delta = np.amax(np.abs(new_q - q[seen]))
+            hist.append(delta)
+            q[seen] = new_q
+
+            if delta < tolerance:
+                logging.info("converged after {:d} iterations".format(iteration))
+                break
+
+        logging.info("transitions: {:d} | iterations: {:d} | time spent: {}"
+                     .format(int(count.sum()), iteration, datetime.now() - start_time))
+        profiler.report()
+
+        return hist, iteration, datetime.now() - start_time
+
+    def __merge(self, transitions, batch_size):
+        """ Merge identical transitions, so an iteration costs the same for a thousand or a million recordings.
+
+            :return np.array, np.array, np.array, np.array, np.array: index of (state, action) in the flattened
+                    Q-table, next state, exit reached, sum of rewards and number of occurrences per unique transition
+        """
+        if isinstance(transitions, str):
+            transitions = TrajectoryReader(transitions)
+        if isinstance(transitions, TrajectoryReader):
+            batches = transitions.batches(batch_size)
+        else:
+            batches = (transitions[start:start + batch_size] for start in range(0, len(transitions), batch_size))
+
+        n_cells, n_actions = self.Q.values.shape
+
+        keys, reward_sums, counts = [], [], []
+        for batch in batches:
+            key = batch["cell"].astype(np.int64) * n_actions + batch["action"]
+            key = (key * n_cells + batch["next_cell"]) * 2 + (batch["status"] == STATUS["win"])
+            unique, inverse, count = np.unique(key, return_inverse=True, return_counts=True)
+            keys.append(unique)
+            reward_sums.append(np.bincount(inverse, weights=batch["reward"], minlength=unique.size))
+            counts.append(count)
+
+        if not keys:
+            raise Exception("Error: no transitions to train on")
+
+        key, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        reward_sum = np.bincount(inverse, weights=np.concatenate(reward_sums), minlength=key.size)
+        count = np.bincount(inverse, weights=np.concatenate(counts), minlength=key.size)
+
+        key, terminal = np.divmod(key, 2)
+        pair, next_cell = np.divmod(key, n_cells)
+
+        return pair, next_cell, terminal.astype(bool), reward_sum, count
@@ -4,28 +4,98 @@ from datetime import datetime
 
 import numpy as np
 
+from metrics import Metrics
 from models import AbstractModel
+from models.evaluator import Evaluator
+from models.table import QTableMixin
 
 
-class QTableTraceModel(AbstractModel):
+class EligibilityTrace:
+    """ Eligibility trace for (state, action) pairs, stored as parallel arrays of fixed size.
+
+        Updating the Q's and decaying the trace are single array operations on the entries in the trace. Entries
+        whose weight drops below 'cutoff' are removed, and when the trace is full the entry with the lowest weight
+        is replaced. So the cost of a step is bounded, however long an episode lasts.
+
+        :param int n_states: Number of states (rows in the Q-table).
+        :param int n_actions: Number of actions (columns in the Q-table).
+        :param int max_length: Maximum number of entries in the trace.
+        :param float cutoff: Entries with a weight below this value are removed.
+    """
+
+    def __init__(self, n_states, n_actions, max_length=256, cutoff=1e-3):
+        self.n_actions = n_actions
+        self.cutoff = cutoff
+        self.states = np.empty(max_length, dtype=np.int64)
+        self.actions = np.empty(max_length, dtype=np.int64)
+        self.weights = np.empty(max_length, dtype=np.float64)
+        self.length = 0  # number of entries in use
+        self.position = np.full(n_states * n_actions, -1, dtype=np.int64)  # (state, action) -> entry, -1 = none
+
+    def __len__(self):
+        return self.length
+
+    def clear(self):
+        """ Remove all entries, e.g. at the start of an episode. """
+        self.position[self.states[:self.length] * self.n_actions + self.actions[:self.length]] = -1
+        self.length = 0
+
+    def visit(self, state, action):
+        """ Increase the weight of (state, action) by 1, adding it to the trace if necessary. """
+        key = state * self.n_actions + action
+        i = self.position[key]
+        if i < 0:
+            if self.length < self.weights.size:
+                i = self.length
+                self.length += 1
+            else:  # full, replace the entry with the lowest weight
+                i = np.argmin(self.weights)
+                self.position[self.states[i] * self.n_actions + self.actions[i]] = -1
+            self.states[i] = state
+            self.actions[i] = action
+            self.weights[i] = 0
+            self.position[key] = i
+        self.weights[i] += 1
+
+    def update(self, values, amount):
+        """ Add amount * weight to the Q of every (state, action) in the trace.
+
+            :param np.array values: Q-table [states][actions], updated in place.
+            :param float amount: Learning rate * temporal difference error.
+        """
+        n = self.length
+        values[self.states[:n], self.actions[:n]] += amount * self.weights[:n]  # (state, action) pairs are unique
+
+    def decay(self, factor):
+        """ Multiply all weights by factor and remove the entries which dropped below the cutoff. """
+        n = self.length
+        self.weights[:n] *= factor
+        keep = self.weights[:n] >= self.cutoff
+        if not keep.all():
+            self.position[self.states[:n][~keep] * self.n_actions + self.actions[:n][~keep]] = -1
+            m = np.count_nonzero(keep)
+            self.states[:m] = self.states[:n][keep]
+            self.actions[:m] = self.actions[:n][keep]
+            self.weights[:m] = self.weights[:n][keep]
+            self.position[self.states[:m] * self.n_actions + self.actions[:m]] = np.arange(m)
+            self.length = m
+
+
+class QTableTraceModel(QTableMixin, AbstractModel):
     """ Prediction model which uses Q-learning, a Q-table and an eligibility trace.
 
         For every state (= maze layout with the agents current location ) the Q for each of the actions is stored.
-        in a table. The key for this table is (state). Initially all Q's are 0. When playing training games after
+        in a table. The row in this table is the agents cell. Initially all Q's are 0. When playing training games after
         every move the Q's in the table are updated using the Bellman equation (= based on the reward gained after
         making the move). Training ends after a fixed number of games, or earlier if a stopping criterion is
         reached (here: a 100% win rate).
-        The model keeps track of the states which have been visited and also updates the Q's of previous
-        state-action pairs based on the current reward (a.k.a. eligibility trace). With every step the amount
-        in which previous Q's are update decays. This approach is meant to speed up learning.
+        The model keeps track of the state-action pairs which have been visited and also updates the Q's of these
+        pairs based on the current reward (a.k.a. eligibility trace). With every step the amount in which previous
+        Q's are update decays. This approach is meant to speed up learning.
 
         :param class Maze game: Maze game object.
     """
 
-    def __init__(self, game, **kwargs):
-        super().__init__(game, **kwargs)
-        self.qtable = dict()
-
     def train(self, **kwargs):
         """ Hyperparameters:
 
@@ -33,24 +103,46 @@ class QTableTraceModel(AbstractModel):
             :keyword float exploration_rate: (epsilon) 0 = preference for exploring (0 = not at all, 1 = only)
             :keyword float exploration_decay: exploration rate reduction after each random step (<= 1, 1 = no at all)
             :keyword float learning_rate: (alpha) preference for using new knowledge (0 = not at all, 1 = only)
-            :keyword float eligibility_decay: (lambda) eligibility trace decay rate per step (0 = no trace, 1 = no decay)
+            :keyword float eligibility_decay: (lambda) eligibility trace decay rate per step (0 = no trace,
+                                              1 = no decay)
+            :keyword float trace_cutoff: remove (state, action) pairs from the trace when their weight is below this
+            :keyword int max_trace_length: maximum number of (state, action) pairs in the trace
             :keyword int episodes: number of training games to play
-            :return int, datetime: number of training episodes, total time spent
+            :keyword Profiler profiler: times the phases of training (default Maze.profiler), see profiling
+            :keyword Metrics metrics: collects the history of training (optional, else a Metrics with a LogSink)
+            :keyword Evaluator evaluator: decides when to check the win rate and when to stop (optional, else default)
+            :return Metrics, int, datetime: training history, number of training episodes, total time spent
         """
         discount = kwargs.get("discount", 0.90)
         exploration_rate = kwargs.get("exploration_rate", 0.10)
         exploration_decay = kwargs.get("exploration_decay", 0.995)  # = 0.5% reduction
         learning_rate = kwargs.get("learning_rate", 0.10)
         eligibility_decay = kwargs.get("eligibility_decay", 0.80)  # = 20% reduction
+        trace_cutoff = kwargs.get("trace_cutoff", 1e-3)
+        max_trace_length = kwargs.get("max_trace_length", 256)
         episodes = kwargs.get("episodes", 1000)
+        profiler = kwargs.get("profiler", self.environment.profiler)
+        hist = kwargs.get("metrics")  # store evolution of status, wins, win rate etc. for reporting purposes
+        if hist is None:
+            hist = Metrics()
+        evaluator = kwargs.get("evaluator")
+        if evaluator is None:
+            evaluator = Evaluator()
+        evaluator.reset()
+
+        self.hyperparameters = dict(discount=discount, exploration_rate=exploration_rate,
+                                    exploration_decay=exploration_decay, learning_rate=learning_rate,
+                                    eligibility_decay=eligibility_decay, trace_cutoff=trace_cutoff,
+                                    max_trace_length=max_trace_length)
+
+        etrace = EligibilityTrace(*self.Q.values.shape, max_length=max_trace_length, cutoff=trace_cutoff)
 
         wins = 0
-        hist = []  # store evolution of win rate for reporting purposes
         start_list = list()
         start_time = datetime.now()
 
         for episode in range(1, episodes):
-            etrace = dict()
+            etrace.clear()
 
             if not start_list:
                 start_list = self.environment.empty.copy()
@@ -59,36 +151,30 @@ class QTableTraceModel(AbstractModel):
             # start_cell = random.choice(self.environment.empty)
 
             state = self.environment.reset(start_cell)
-            state = tuple(state.flatten())
-
-            if state not in self.qtable.keys():
-                self.qtable[state] = [0, 0, 0, 0]  # Q's for 4 possible actions
+            state = self.Q.index(state)
 
             while True:
-                try:
-                    etrace[state] += 1
-                except KeyError:
-                    etrace[state] = 1
+                with profiler.phase("predict"):
+                    if np.random.random() < exploration_rate:
+                        action = random.choice(self.environment.actions)
+                    else:
+                        action = self.predict(state)
 
-                if np.random.random() < exploration_rate:
-                    action = random.choice(self.environment.actions)
-                else:
-                    action = self.predict(state)
+                etrace.visit(state, action)
 
-                next_state, reward, status = self.environment.step(action)
-                next_state = tuple(next_state.flatten())
-                if next_state not in self.qtable.keys():
-                    self.qtable[next_state] = [0, 0, 0, 0]
+                with profiler.phase("step"):
+                    next_state, reward, status = self.environment.step(action)
+                    next_state = self.Q.index(next_state)
 
-                # update Q's in trace
-                delta = reward + discount * max(self.qtable[next_state]) - self.qtable[state][action]
+                with profiler.phase("update"):
+                    # update Q's in trace
+                    delta = reward + discount * self.Q.values[next_state].max() - \
+                        self.Q.values[state, action]
 
-                for key in etrace.keys():
-                    self.qtable[key][action] += learning_rate * delta * etrace[key]
+                    etrace.update(self.Q.values, learning_rate * delta)
 
-                # decay eligibility trace
-                for key in etrace.keys():
-                    etrace[key] *= (discount * eligibility_decay)
+                    # decay eligibility trace
+                    etrace.decay(discount * eligibility_decay)
 
                 if status in ("win", "lose"):  # terminal state reached, stop episode
                     if status == "win":
@@ -97,40 +183,23 @@ class QTableTraceModel(AbstractModel):
 
                 state = next_state
 
-            logging.info("episode: {:d}/{:d} | status: {:4s} | total wins: {:d} | e: {:.5f}"
-                         .format(episode, episodes, status, wins, exploration_rate))
+            hist.record(episode, status, wins, exploration_rate)
 
-            if episode % 5 == 0:
+            if evaluator.due(episode):
                 # check if the current model wins from all starting cells
                 # can only do this if there is a finite number of starting states
-                w_all, win_rate = self.environment.win_all(self)
-                hist.append(win_rate)
-                if w_all is True:
+                with profiler.phase("win_all"):
+                    stop, win_rate, full = evaluator.evaluate(self, episode)
+                hist.record_win_rate(win_rate, full)
+                if stop is True:
                     logging.info("won from all start cells, stop learning")
                     break
 
             exploration_rate *= exploration_decay
 
+        hist.flush()
+
         logging.info("episodes: {:d} | time spent: {}".format(episode, datetime.now() - start_time))
+        profiler.report()
 
         return hist, episode, datetime.now() - start_time
-
-    def predict(self, state):
-        """ Policy: choose the action with the highest Q from the Q-table. Random choice if multiple actions
-            have the same (max) Q.
-
-            :param np.array state: Game state (= index in the Q table).
-            :return int: Chosen action.
-        """
-        if type(state) == np.ndarray:
-            state = tuple(state.flatten())
-
-        try:
-            q = self.qtable[state]
-        except KeyError:
-            q = [0, 0, 0, 0]
-        logging.debug("q[] = {}".format(q))
-
-        mv = np.amax(q)  # determine max Q
-        actions = np.nonzero(q == mv)[0]  # extract (index of) action(s) with the max Q
-        return random.choice(actions)
@@ -0,0 +1,161 @@
+""" Dense storage for Q-tables.
+"""
+import json
+import logging
+import random
+import struct
+
+import numpy as np
+
+from environment.maze import CELL_CURRENT
+
+
+class QTable:
+    """ Table with the Q's for every (state, action) combination, stored in a preallocated array.
+
+        The only part of the state which changes during a game is the location of the agent. Therefore every state
+        is mapped onto the index of the agents cell in the flattened maze, and the Q's are stored in a float32 array
+        with one row per cell and one column per action. Looking up the Q's of a state is a row lookup, and every
+        state takes up num_actions * 4 bytes. Q's of states which have not been visited yet are 0.
+
+        :param int n_cells: Number of cells in the maze.
+        :param int n_actions: Number of actions the agent can choose from.
+        :param decode: Function which derives the cell index from a state (optional, else the state must be the
+                       complete maze as returned by Maze in observation mode "grid"), usually Maze.state_index.
+    """
+
+    MAGIC = b"QTABLE01"  # identifies the file format
+    ALIGNMENT = 64  # the Q's in a file start at a multiple of this many bytes
+
+    def __init__(self, n_cells, n_actions, dtype=np.float32, decode=None):
+        self.values = np.zeros((n_cells, n_actions), dtype=dtype)
+        self.decode = decode
+        self.header = dict()  # header of the file this table was loaded from
+
+    def index(self, state):
+        """ Convert a state to the index of the row containing its Q's.
+
+            :param state: Game state as returned by Maze (np.array or tuple), or a cell index.
+            :return int: Row index in the table.
+        """
+        if isinstance(state, (int, np.integer)):
+            return int(state)
+        if self.decode is not None:
+            return self.decode(state)
+        return int(np.argmax(np.asarray(state).ravel() == CELL_CURRENT))  # location of the agent
+
+    def __getitem__(self, state):
+        """ Return the Q's for all actions in this state.
+
+            :param state: Game state or cell index.
+            :return np.array: Q per action.
+        """
+        return self.values[self.index(state)]
+
+    def save(self, filename, fingerprint, **kwargs):
+        """ Save the table to filename.qtable.
+
+            The file starts with a JSON header containing the shape of the table, the fingerprint of the maze and
+            any additional keyword arguments (e.g. the hyperparameters used for training). The header is padded
+            so the Q's, which follow as a raw float32 array, are aligned and can be memory mapped by load().
+            Every row in the array belongs to the cell with the same index, so no separate index is stored.
+
+            :param str filename: File name without extension.
+            :param str fingerprint: Fingerprint of the maze the table belongs to (see Maze.fingerprint()).
+        """
+        header = dict(kwargs, shape=list(self.values.shape), dtype="float32", fingerprint=fingerprint)
+        data = json.dumps(header).encode()
+        offset = len(self.MAGIC) + 4 + len(data)
+        data += b" " * (-offset % self.ALIGNMENT)
+
+        with open(filename + ".qtable", "wb") as outfile:
+            outfile.write(self.MAGIC)
+            outfile.write(struct.pack("<I", len(data)))
+            outfile.write(data)
+            outfile.write(np.ascontiguousarray(self.values, dtype="<f4").tobytes())
+
+    @classmethod
+    def load(cls, filename, fingerprint=None, mmap=True, decode=None):
+        """ Load a table from a file written by save().
+
+            With mmap the Q's are memory mapped in copy-on-write mode: processes which load the same file share
+            its pages, and updating the Q's (e.g. by training further) changes only a private copy, not the file.
+
+            :param str filename: File name without extension.
+            :param str fingerprint: Fingerprint of the maze the table will be used for (optional, else not checked).
+            :param bool mmap: Memory map the Q's instead of reading them into memory.
+            :param decode: Function which derives the cell index from a state (see class docstring).
+            :return QTable: The table, with the file header in attribute 'header'.
+        """
+        with open(filename + ".qtable", "rb") as infile:
+            if infile.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise Exception("Error: {}.qtable is not a Q-table file".format(filename))
+            length, = struct.unpack("<I", infile.read(4))
+            header = json.loads(infile.read(length).decode())
+
+        if fingerprint is not None and header["fingerprint"] != fingerprint:
+            raise Exception("Error: {}.qtable was created for a different maze".format(filename))
+
+        n_cells, n_actions = header["shape"]
+        offset = len(cls.MAGIC) + 4 + length
+
+        table = cls(0, n_actions, decode=decode)
+        if mmap:
+            table.values = np.memmap(filename + ".qtable", dtype="<f4", mode="c", offset=offset,
+                                     shape=(n_cells, n_actions))
+        else:
+            table.values = np.fromfile(filename + ".qtable", dtype="<f4", offset=offset).reshape(n_cells, n_actions)
+        table.header = header
+
+        return table
+
+
+class QTableMixin:
+    """ Keep the Q's of a model in a QTable in attribute Q, save and load them together with the hyperparameters
+        of the last training, and choose actions greedily from them. Place it before AbstractModel in the base
+        classes of a model.
+
+        :param class Maze game: Maze game object.
+        :keyword bool load: load the Q-table from file 'name'.qtable instead of starting with all Q's 0
+    """
+
+    def __init__(self, game, **kwargs):
+        super().__init__(game, **kwargs)
+        self.Q = QTable(game.maze.size, len(game.actions), decode=game.state_index)  # Q per (state, action)
+        self.hyperparameters = dict()  # hyperparameters used in the last training, saved with the Q-table
+
+        if kwargs.get("load", False) is True:
+            self.load(self.name)
+
+    def save(self, filename):
+        """ Save the Q-table to filename.qtable. """
+        self.Q.save(filename, self.environment.fingerprint(), model=type(self).__name__,
+                    hyperparameters=self.hyperparameters)
+
+    def load(self, filename):
+        """ Load the Q-table from filename.qtable (memory mapped, so processes loading the same file share it). """
+        self.Q = QTable.load(filename, self.environment.fingerprint(), decode=self.environment.state_index)
+        self.hyperparameters = self.Q.header.get("hyperparameters", dict())
+
+    def q(self, state):
+        """ Get the Q's for all actions in state from the Q-table.
+
+            :param np.array state: Game state (or the index of its row in the Q-table).
+            :return np.array: Q per action.
+        """
+        return self.Q[state]
+
+    def predict(self, state):
+        """ Policy: choose the action with the highest Q from the Q-table. Random choice if multiple actions
+            have the same (max) Q.
+
+            :param np.array state: Game state (or the index of its row in the Q-table).
+            :return int: Chosen action.
+        """
+        q = self.q(state)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("q[] = {}".format(q))
+
+        mv = np.amax(q)  # determine max Q
+        actions = np.nonzero(q == mv)[0]  # extract (index of) action(s) with the max Q
+        return random.choice(actions)
@@ -0,0 +1,247 @@
+import logging
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from environment.maze import NO_CELL
+from models import AbstractModel
+from models.table import QTableMixin
+
+
+def transition_model(game):
+    """ Describe the maze as a deterministic MDP with one state per cell.
+
+        Moving to a free cell costs -0.04, reaching the exit is rewarded with +1 and ends the game, and running
+        into a wall costs -0.75 and leaves the agent where it is. The extra penalty for returning to a visited cell
+        depends on the history of the game and is therefore not part of this model.
+
+        :param class Maze game: Maze game object.
+        :return np.array, np.array, np.array: next cell [size][num_actions], reward [size][num_actions],
+                                              terminal [size]
+    """
+    cells = np.arange(game.maze.size)
+    blocked = game.transitions == NO_CELL
+
+    next_cells = np.where(blocked, cells[:, None], game.transitions)
+
+    rewards = np.where(blocked, -0.75, -0.04)
+    rewards[~blocked & (next_cells == game.cell_index(game.exit_cell))] = 1.0
+
+    terminal = np.zeros(game.maze.size, dtype=bool)
+    terminal[game.cell_index(game.exit_cell)] = True
+
+    return next_cells, rewards, terminal
+
+
+def exit_distance(game):
+    """ Count the minimal number of moves from every cell to the exit (breadth first search backwards from the exit).
+
+        :param class Maze game: Maze game object.
+        :return np.array [size]: Number of moves, or -1 if the exit cannot be reached from the cell.
+    """
+    predecessors = [[] for _ in range(game.maze.size)]
+    for cell, target in zip(*np.nonzero(game.transitions != NO_CELL)):
+        predecessors[game.transitions[cell, target]].append(cell)
+
+    exit_index = game.cell_index(game.exit_cell)
+    distance = np.full(game.maze.size, -1, dtype=np.int64)
+    distance[exit_index] = 0
+    queue = deque([exit_index])
+    while queue:
+        cell = queue.popleft()
+        for previous in predecessors[cell]:
+            if distance[previous] < 0:
+                distance[previous] = distance[cell] + 1
+                queue.append(previous)
+
+    return distance
+
+
+def greedy_policy(q, next_distance):
+    """ Determine the greedy action per cell, breaking ties by the number of moves to the exit.
+
+        Q's which differ less than a few units in the last place count as tied, as rounding errors can be that
+        large. A tie is unresolved if the tied actions lead to cells at different distances from the exit, as
+        their Q's should differ but (yet) do not. Actions leading to cells at the same distance are equally good.
+
+        :param np.array q: Q per cell and action [size][num_actions] (float64).
+        :param np.array next_distance: Number of moves to the exit after each action [size][num_actions], np.inf
+                                       if the exit cannot be reached.
+        :return np.array, np.array: action per cell [size], True for the cells with unresolved ties [size]
+    """
+    best = q.max(axis=1, keepdims=True)
+    near_best = q >= best - 16 * np.abs(np.spacing(best))
+    nearest = np.where(near_best, next_distance, np.inf).min(axis=1)
+    farthest = np.where(near_best, next_distance, -np.inf).max(axis=1)
+    ties = np.isfinite(nearest) & (nearest != farthest)
+    return np.where(near_best, next_distance, np.inf).argmin(axis=1), ties
+
+
+def next_distance(game, next_cells):
+    """ Number of moves to the exit after every (cell, action), np.inf if the exit cannot be reached. """
+    distance = exit_distance(game).astype(float)
+    distance[distance < 0] = np.inf
+    distance = distance[next_cells]
+    distance[game.cell_index(game.exit_cell)] = np.inf  # the game ends at the exit, so there is no next move
+    return distance
+
+
+class ValueIterationModel(QTableMixin, AbstractModel):
+    """ Prediction model which calculates the Q's with value iteration instead of learning them by playing.
+
+        The maze is completely known, so the Bellman optimality equation can be solved directly. Every sweep
+        updates the Q's of all cells at once: Q(s, a) = r(s, a) + gamma * max Q(s', a'). Sweeps stop when the
+        greedy policy no longer changes and has no unresolved ties (see greedy_policy()), or when the Q's no longer
+        change. The result is stored in the same kind of Q-table as the
+        QTableModel uses, and serves as a reference for the learning models.
+
+        A note on the discount horizon:
+        The Q's of two actions whose paths to the exit differ one move in length differ by about gamma^d, with d
+        the number of moves to the exit. Beyond roughly log(1e-16) / log(gamma) moves (about 350 for gamma = 0.90)
+        this is below the resolution of a float64, and already beyond about 165 moves below that of the float32
+        Q-table. The Q's are therefore calculated in float64, remaining ties are broken by the number of moves to
+        the exit (see exit_distance()), and in the Q-table the other actions are lowered just below the chosen one.
+        So the policy is optimal, but far from the exit the Q's themselves only represent it to this extent.
+
+        :param class Maze game: Maze game object.
+    """
+
+    def train(self, **kwargs):
+        """ Hyperparameters:
+
+            :keyword float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+            :keyword float tolerance: also stop when the largest change in a sweep is not more than this (ties
+                                      which remain are broken by the number of moves to the exit)
+            :keyword int max_sweeps: maximum number of sweeps over all cells
+            :keyword Profiler profiler: times the phases of training (default Maze.profiler), see profiling
+            :return list, int, datetime: largest change per sweep, number of sweeps, total time spent
+        """
+        discount = kwargs.get("discount", 0.90)
+        tolerance = kwargs.get("tolerance", 0.0)
+        max_sweeps = kwargs.get("max_sweeps", 10000)
+        profiler = kwargs.get("profiler", self.environment.profiler)
+
+        self.hyperparameters = dict(discount=discount, tolerance=tolerance)
+
+        next_cells, rewards, terminal = transition_model(self.environment)
+        distance = next_distance(self.environment, next_cells)
+
+        hist = []  # store evolution of the largest change for reporting purposes
+        start_time = datetime.now()
+
+        v = np.zeros(self.environment.maze.size)
+        policy = None
+
+        for sweep in range(1, max_sweeps + 1):
+            with profiler.phase("sweep"):
+                q = rewards + discount * v[next_cells]
+                new_v = np.where(terminal, 0.0, q.max(axis=1))
+                previous, (policy, ties) = policy, greedy_policy(q, distance)
+
+            delta = np.amax(np.abs(new_v - v))
+            hist.append(delta)
+            v = new_v
+
+            if np.array_equal(policy, previous) and not np.any(ties):
+                logging.info("policy stable after {:d} sweeps".format(sweep))
+                break
+            if delta <= tolerance:
+                logging.info("converged after {:d} sweeps, {:d} cells with tied Q's"
+                             .format(sweep, np.count_nonzero(ties)))
+                break
+
+        self.store(rewards + discount * v[next_cells], distance)
+
+        logging.info("sweeps: {:d} | time spent: {}".format(sweep, datetime.now() - start_time))
+        profiler.report()
+
+        return hist, sweep, datetime.now() - start_time
+
+    def store(self, q, distance):
+        """ Store the Q's in the Q-table so the greedy action (see greedy_policy()) of every cell from which the exit
+            can be reached is unique.
+
+            :param np.array q: Q per cell and action [size][num_actions] (float64).
+            :param np.array distance: Number of moves to the exit after each action, see next_distance().
+        """
+        action, _ = greedy_policy(q, distance)
+
+        values = q.astype(np.float32)
+        rows = np.flatnonzero(np.isfinite(distance.min(axis=1)))
+        chosen = values[rows, action[rows]][:, None]
+        lower = np.nextafter(chosen, np.float32(-np.inf))
+        others = np.arange(values.shape[1]) != action[rows][:, None]
+        values[rows] = np.where(others & (values[rows] >= chosen), lower, values[rows])
+
+        self.Q.values[:] = values
+
+
+class PolicyIterationModel(ValueIterationModel):
+    """ Prediction model which calculates the Q's with policy iteration.
+
+        Starting from an arbitrary policy, the value of the current policy is calculated by sweeping over all
+        cells until the values no longer change (policy evaluation). Then the policy is replaced by the greedy
+        policy for these values (policy improvement). This repeats until the policy is stable. The same discount
+        horizon applies as for ValueIterationModel (see there).
+
+        :param class Maze game: Maze game object.
+    """
+
+    def train(self, **kwargs):
+        """ Hyperparameters:
+
+            :keyword float discount: (gamma) preference for future rewards (0 = not at all, 1 = only)
+            :keyword float tolerance: stop policy evaluation when the largest change is not more than this
+            :keyword int max_sweeps: maximum number of evaluation sweeps per policy
+            :keyword int max_iterations: maximum number of policy improvements
+            :keyword Profiler profiler: times the phases of training (default Maze.profiler), see profiling
+            :return list, int, datetime: evaluation sweeps per iteration, number of iterations, total time spent
+        """
+        discount = kwargs.get("discount", 0.90)
+        tolerance = kwargs.get("tolerance", 0.0)
+        max_sweeps = kwargs.get("max_sweeps", 10000)
+        max_iterations = kwargs.get("max_iterations", 1000)
+        profiler = kwargs.get("profiler", self.environment.profiler)
+
+        self.hyperparameters = dict(discount=discount, tolerance=tolerance)
+
+        next_cells, rewards, terminal = transition_model(self.environment)
+        distance = next_distance(self.environment, next_cells)
+
+        hist = []  # store the number of evaluation sweeps per iteration for reporting purposes
+        start_time = datetime.now()
+
+        cells = np.arange(self.environment.maze.size)
+        policy = np.zeros(self.environment.maze.size, dtype=np.int64)
+        v = np.zeros(self.environment.maze.size)
+
+        for iteration in range(1, max_iterations + 1):
+            # policy evaluation
+            with profiler.phase("evaluation"):
+                for sweep in range(1, max_sweeps + 1):
+                    new_v = np.where(terminal, 0.0, rewards[cells, policy] + discount * v[next_cells[cells, policy]])
+                    delta = np.amax(np.abs(new_v - v))
+                    v = new_v
+                    if delta <= tolerance:
+                        break
+            hist.append(sweep)
+
+            # policy improvement, keep the current action if it is as good as the best one to avoid oscillating
+            with profiler.phase("improvement"):
+                q = rewards + discount * v[next_cells]
+                best = q.argmax(axis=1)
+                current = q[cells, policy]
+                improved = q[cells, best] > current + max(tolerance, 16 * np.spacing(np.amax(np.abs(current))))
+            if not np.any(improved):
+                logging.info("policy stable after {:d} iterations".format(iteration))
+                break
+            policy = np.where(improved, best, policy)
+
+        self.store(rewards + discount * v[next_cells], distance)
+
+        logging.info("iterations: {:d} | sweeps: {:d} | time spent: {}"
+                     .format(iteration, sum(hist), datetime.now() - start_time))
+        profiler.report()
+
+        return hist, iteration, datetime.now() - start_time
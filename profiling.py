@@ -0,0 +1,151 @@
+""" Measure where training time goes, per phase (e.g. step, predict, update, fit, win_all).
+
+    A phase is timed by running it inside 'with profiler.phase(name):'. The profiler keeps the cumulative time
+    and number of calls per phase, using time.perf_counter() only, so the overhead is well below a microsecond
+    per call. Maze and all models use the profiler in Maze.profiler (or the one passed to train() as keyword
+    'profiler'); by default this is a NullProfiler which does nothing.
+
+    cProfile, or any other profiler with enable()/disable() or start()/stop() methods such as a sampling
+    profiler, can be attached to a single phase. It then only runs while that phase is active.
+
+    Usage:
+        game.profiler = Profiler("profile.json")
+        stats = game.profiler.attach_cprofile("fit")
+        model.train()  # logs a summary table at the end and writes the timings to profile.json
+        stats.print_stats("cumulative")
+"""
+import cProfile
+import json
+import logging
+import time
+
+
+class _Phase:
+    """ Context manager which adds the time spent inside it to the totals of a phase. """
+
+    __slots__ = ("name", "seconds", "calls", "hook", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.hook = None  # profiler which only runs during this phase
+        self.start = 0.0
+
+    def __enter__(self):
+        if self.hook is not None:
+            self.hook[0]()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds += time.perf_counter() - self.start
+        self.calls += 1
+        if self.hook is not None:
+            self.hook[1]()
+
+
+class Profiler:
+    """ Record the cumulative time and number of calls per phase.
+
+        :param str filename: JSON file report() writes the timings to (optional, else only log the summary).
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.phases = dict()  # phase name -> _Phase
+        self.start = time.perf_counter()
+
+    def phase(self, name):
+        """ Return the context manager which times phase 'name'. """
+        try:
+            return self.phases[name]
+        except KeyError:
+            self.phases[name] = _Phase(name)
+            return self.phases[name]
+
+    def attach(self, name, profiler):
+        """ Run 'profiler' only while phase 'name' is active.
+
+            :param str name: Phase name.
+            :param profiler: Object with enable() and disable() methods (like cProfile.Profile), or start() and
+                             stop() methods (like most sampling profilers).
+        """
+        if hasattr(profiler, "enable"):
+            self.phase(name).hook = (profiler.enable, profiler.disable)
+        else:
+            self.phase(name).hook = (profiler.start, profiler.stop)
+
+    def attach_cprofile(self, name):
+        """ Run cProfile while phase 'name' is active.
+
+            :return cProfile.Profile: The collected statistics, e.g. use print_stats() or dump_stats().
+        """
+        profile = cProfile.Profile()
+        self.attach(name, profile)
+        return profile
+
+    def reset(self):
+        """ Forget all timings, attached profilers stay attached. """
+        for phase in self.phases.values():
+            phase.seconds = 0.0
+            phase.calls = 0
+        self.start = time.perf_counter()
+
+    def results(self):
+        """ Return the timings as a dict, which can be written as JSON.
+
+            :return dict: Wall time since creation or reset(), and calls and seconds per phase.
+        """
+        return dict(wall_seconds=time.perf_counter() - self.start,
+                    phases={p.name: dict(calls=p.calls, seconds=p.seconds) for p in self.phases.values()})
+
+    def summary(self):
+        """ Return a table with the calls, total time, time per call and share of the wall time per phase.
+
+            Phases can be nested (e.g. execute is part of step), so the shares can add up to more than 100%.
+        """
+        results = self.results()
+        wall = results["wall_seconds"]
+        lines = ["{:16s} {:>10s} {:>10s} {:>12s} {:>7s}".format("phase", "calls", "seconds", "us/call", "%wall")]
+        for name, p in sorted(results["phases"].items(), key=lambda item: -item[1]["seconds"]):
+            if p["calls"] == 0:
+                continue
+            lines.append("{:16s} {:10d} {:10.3f} {:12.2f} {:7.1f}"
+                         .format(name, p["calls"], p["seconds"], 1e6 * p["seconds"] / max(1, p["calls"]),
+                                 100 * p["seconds"] / wall if wall > 0 else 0.0))
+        lines.append("{:16s} {:10s} {:10.3f}".format("wall", "", wall))
+        return "\n".join(lines)
+
+    def dump(self, filename):
+        """ Write the timings to a JSON file. """
+        with open(filename, "w") as outfile:
+            json.dump(self.results(), outfile, indent=4)
+
+    def report(self):
+        """ Log the summary table, and write the timings to the file given when creating the profiler. """
+        logging.info("profile:\n{}".format(self.summary()))
+        if self.filename is not None:
+            self.dump(self.filename)
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class NullProfiler:
+    """ Profiler which does not measure anything, the default when no profiling is wanted. """
+
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def report(self):
+        pass
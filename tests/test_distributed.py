@@ -0,0 +1,77 @@
+""" Regression check for actor/learner training of QReplayNetworkModel (see models.distributed). """
+import random
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from environment import Maze
+from environment.maze import NO_CELL
+from models import QReplayNetworkModel
+from models.distributed import _actor, _flatten
+from models.network import NumpyNetwork
+
+MAZE = np.array([
+    [0, 1, 0, 0, 0, 0, 0, 0],
+    [0, 1, 0, 1, 0, 1, 0, 0],
+    [0, 0, 0, 1, 1, 0, 1, 0],
+    [0, 1, 0, 1, 0, 0, 0, 0],
+    [1, 0, 0, 1, 0, 1, 0, 0],
+    [0, 0, 0, 1, 0, 1, 1, 1],
+    [0, 1, 1, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 1, 0, 0]
+])  # the maze from main.py
+
+
+class Value:
+    """ Stands in for the shared version counter of the learner. """
+    value = 0
+
+
+class Transitions:
+    """ Stands in for the queue to the learner, keeps the first game and then stops the actor. """
+
+    def __init__(self, stop):
+        self.stop = stop
+        self.games = []
+
+    def put(self, game_record, timeout=None):
+        self.games.append(game_record)
+        self.stop.set()
+
+
+def test_actor_copies_reused_states():
+    game = Maze(MAZE, reuse_buffers=True)
+    layers = [game.observation_size, game.maze.size, len(game.actions)]
+    weights = NumpyNetwork(layers).get_weights()
+    flat = _flatten(weights)
+
+    shm = shared_memory.SharedMemory(create=True, size=flat.nbytes)
+    try:
+        np.ndarray(flat.size, dtype=np.float32, buffer=shm.buf)[:] = flat
+        stop = threading.Event()
+        transitions = Transitions(stop)
+        _actor(game, layers, shm.name, [w.shape for w in weights], Value(), threading.Lock(), transitions, stop, 1.0)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    states, actions, _, next_states, _ = transitions.games[0]
+    cells = [game.state_index(state) for state in states]
+    next_cells = [game.state_index(state) for state in next_states]
+
+    assert cells[1:] == next_cells[:-1]  # every transition starts where the previous one ended
+    for cell, action, next_cell in zip(cells, actions, next_cells):
+        target = game.transitions[cell, action]
+        assert next_cell == (cell if target == NO_CELL else target)
+
+
+def test_actor_learner_wins_from_all_cells(tmp_path):
+    random.seed(0)
+    np.random.seed(0)
+
+    game = Maze(MAZE, reuse_buffers=True)  # the actors must copy the states they send, not keep the buffers
+    model = QReplayNetworkModel(game, name=str(tmp_path / "model"))
+    model.train(discount=0.90, exploration_rate=0.10, episodes=1000, max_memory=MAZE.size * 8, actors=2)
+
+    assert game.win_all(model)[0]
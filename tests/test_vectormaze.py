@@ -0,0 +1,48 @@
+""" Check that VectorMaze applies the same rules as Maze. """
+import numpy as np
+
+from environment import Maze, VectorMaze
+from environment.generator import generate
+
+MAZE = np.array([
+    [0, 1, 0, 0, 0, 0, 0, 0],
+    [0, 1, 0, 1, 0, 1, 0, 0],
+    [0, 0, 0, 1, 1, 0, 1, 0],
+    [0, 1, 0, 1, 0, 0, 0, 0],
+    [1, 0, 0, 1, 0, 1, 0, 0],
+    [0, 0, 0, 1, 0, 1, 1, 1],
+    [0, 1, 1, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 1, 0, 0]
+])  # the maze from main.py
+
+
+def check_same_as_maze(maze, n, steps):
+    vector = VectorMaze(maze, n)
+    cells = vector.reset()
+    games = [Maze(maze) for _ in range(n)]
+    for game, cell in zip(games, cells):
+        game.reset(game.index_cell(cell))
+
+    for _ in range(steps):
+        actions = np.random.randint(len(vector.actions), size=n)
+        states, rewards, statuses = vector.step(actions)
+
+        for agent, game in enumerate(games):
+            state, reward, status = game.step(actions[agent])
+            assert reward == rewards[agent]
+            assert status == statuses[agent]
+            if status == "playing":
+                assert game.state_index(state) == states[agent]
+                assert np.array_equal(state, vector.grids([agent]))
+            else:  # the vector maze has placed the agent at a new start cell
+                game.reset(game.index_cell(states[agent]))
+
+
+def test_same_as_maze():
+    np.random.seed(0)
+    check_same_as_maze(MAZE, 50, 300)
+
+
+def test_same_as_maze_with_dead_ends():
+    np.random.seed(1)
+    check_same_as_maze(generate(12, 12, "random", 1), 50, 300)